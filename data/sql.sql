@@ -11,7 +11,8 @@ CREATE TABLE poc (
     created_time TEXT,
     request TEXT,
     payloads TEXT,
-    rules TEXT        
+    rules TEXT,
+    product_tags TEXT DEFAULT ''
 )
 
 
@@ -25,5 +26,6 @@ CREATE TABLE pocscript (
     need_cookie BOOLEAN,
     write_content BOOLEAN,
     created_time TEXT,
-    scriptname TEXT     
+    scriptname TEXT,
+    product_tags TEXT DEFAULT ''
 )
\ No newline at end of file
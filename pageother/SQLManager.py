@@ -2,6 +2,8 @@ import sqlite3
 import json
 from time import time
 
+from scan.Fingerprint import ensure_product_tags, infer_product_tags
+
 def verify_pocid(poc_id: str ,verify: str = None)->list:
     if verify is None:
         conn = sqlite3.connect('./data/db/poc.db')
@@ -18,6 +20,11 @@ def verify_pocid(poc_id: str ,verify: str = None)->list:
     else:
         return False
 
+def update_product_tags(conn, db: str, poc_id: str, vul_name: str):
+    """根据漏洞名称更新POC的产品标签，用于扫描前按目标指纹裁剪POC"""
+    ensure_product_tags(conn, db)
+    conn.execute(f"UPDATE {db} SET product_tags = ? WHERE poc_id = ?", (infer_product_tags(vul_name), poc_id))
+
 def insert_poc(data: dict)->bool:
     conn = sqlite3.connect('./data/db/poc.db')
     cursor = conn.cursor()
@@ -54,6 +61,7 @@ def insert_poc(data: dict)->bool:
             payloads_json,
             rules_json
         ))
+    update_product_tags(conn, "poc", data['basic_info']['poc_id'], data['basic_info']['vul_name'])
     conn.commit()
     cursor.close()
     return True
@@ -212,6 +220,7 @@ def update_poc(data: dict)->bool:
             rules_json,
             data['basic_info']['poc_id']
         ))
+    update_product_tags(conn, "poc", data['basic_info']['poc_id'], data['basic_info']['vul_name'])
     conn.commit()
     cursor.close()
     return True
@@ -246,6 +255,7 @@ def insert_poc_script(data: dict)->bool:
             data['scriptname']
             
         ))
+    update_product_tags(conn, "pocscript", data['poc_id'], data['vul_name'])
     conn.commit()
     cursor.close()
     return True
@@ -275,6 +285,7 @@ def update_poc_script(data: dict)->bool:
             data['scriptname'],
             data['poc_id']
         ))
+    update_product_tags(conn, "pocscript", data['poc_id'], data['vul_name'])
     conn.commit()
     cursor.close()
     return True
\ No newline at end of file
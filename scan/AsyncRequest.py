@@ -1,22 +1,155 @@
 import asyncio
+import importlib.util
 import random
-from typing import Optional, Dict, Any
+import time
+from typing import Optional, Dict, Any, Callable
 import httpx
 
 from scan.LogManager import write_error_log
+from scan.TlsContext import ssl_context
+
+
+def url_host(url) -> str:
+    """目标的主机标识(host:port)"""
+    parsed = url if isinstance(url, httpx.URL) else httpx.URL(url)
+    return f"{parsed.host}:{parsed.port or (443 if parsed.scheme == 'https' else 80)}"
+
+
+class CircuitBreaker:
+    """
+    按目标(host:port)熔断
+    closed: 正常请求，连续连接失败/超时达到阈值后进入open
+    open: 直接失败，冷却时间过后进入half-open
+    half-open: 只放行一个探测请求，成功则恢复closed，失败则重新open
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 30):
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.states: Dict[str, list] = {}
+
+    def _state(self, host: str) -> list:
+        # [状态, 连续失败次数, 进入open/开始探测的时间]
+        state = self.states.get(host)
+        if state is None:
+            state = self.states[host] = [self.CLOSED, 0, 0.0]
+        return state
+
+    def available(self, host: str) -> bool:
+        """目标是否可能放行请求(不占用half-open的探测名额)"""
+        state = self.states.get(host)
+        if state is None or state[0] == self.CLOSED:
+            return True
+        return time.monotonic() - state[2] >= self.cooldown
+
+    def allow(self, host: str) -> bool:
+        """请求前调用，返回是否放行"""
+        state = self._state(host)
+        if state[0] == self.CLOSED:
+            return True
+        if time.monotonic() - state[2] < self.cooldown:
+            return False
+        # 冷却结束(或上一个探测超时未返回)，放行一个探测请求
+        state[0] = self.HALF_OPEN
+        state[2] = time.monotonic()
+        return True
+
+    def record_success(self, host: str):
+        state = self._state(host)
+        state[0] = self.CLOSED
+        state[1] = 0
+
+    def record_failure(self, host: str) -> bool:
+        """记录一次连接失败/超时，返回是否因此进入open"""
+        state = self._state(host)
+        state[1] += 1
+        if state[0] == self.HALF_OPEN or (state[0] == self.CLOSED and state[1] >= self.failure_threshold):
+            state[0] = self.OPEN
+            state[2] = time.monotonic()
+            return True
+        return False
+
+
+def http2_available() -> bool:
+    """是否安装了HTTP/2支持所需的h2(pip install httpx[http2])"""
+    return importlib.util.find_spec('h2') is not None
+
+
+def wrap_network_backends(client: httpx.AsyncClient, wrap: Callable[[Any], Any], wrapper_type: type):
+    """
+    替换client所有连接池(含代理)的httpcore网络后端，wrap(原后端)返回新后端
+    已经被wrapper_type包装过的连接池不再重复包装
+    """
+    for transport in [client._transport, *client._mounts.values()]:
+        # ProxyHealthTransport等包装的transport
+        transport = getattr(transport, 'transport', transport)
+        pool = getattr(transport, '_pool', None)
+        if pool is not None and not isinstance(pool._network_backend, wrapper_type):
+            pool._network_backend = wrap(pool._network_backend)
 
 
 def make_async_client(
         timeout: Optional[httpx.Timeout] = None,
         limits: Optional[httpx.Limits] = None,
-        proxies: Optional[Dict[str, str]]  = None
+        proxies: Optional[Dict[str, str]]  = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        http2: bool = False
 )-> httpx.AsyncClient:
-    """创建异步客户端"""
+    """
+    创建异步客户端
+    transport 自定义transport(连接池限制、http2需由transport自身设置)
+    http2 启用HTTP/2，服务端通过ALPN协商支持时同一主机的请求复用一个连接；未安装h2时使用HTTP/1.1
+    使用进程内共享的SSLContext，见scan.TlsContext
+    """
+    http2 = http2 and http2_available()
     if timeout is None:
         timeout = httpx.Timeout(connect=5, read=10, write=10, pool=10)
     if limits is None:
         limits = httpx.Limits(max_connections=100, max_keepalive_connections=10)
-    return httpx.AsyncClient(timeout=timeout, limits=limits,proxies=proxies)
+    return httpx.AsyncClient(timeout=timeout, limits=limits,proxies=proxies, transport=transport,
+                             http2=http2, verify=ssl_context(http2=http2))
+
+# 规则结论确定后，剩余内容不超过该字节数时仍然读完，以便复用连接
+DRAIN_LIMIT = 64 * 1024
+
+
+def _remaining_bytes(response: httpx.Response) -> float:
+    """响应体剩余未下载的字节数，没有Content-Length时视为无限"""
+    try:
+        return int(response.headers['Content-Length']) - response.num_bytes_downloaded
+    except (KeyError, ValueError):
+        return float('inf')
+
+
+async def read_body(response: httpx.Response, max_body_size: int, scanner: Any = None):
+    """
+    流式读取响应体，最多读取max_body_size字节，超出部分丢弃
+    scanner 增量规则评估器(start/feed/finish)，规则结论确定后停止读取
+    读取到的内容作为响应体(response.content)
+    """
+    chunks = []
+    size = 0
+    done = scanner is not None and scanner.start(response)
+    try:
+        if not (done and _remaining_bytes(response) > DRAIN_LIMIT):
+            async for chunk in response.aiter_bytes():
+                if size + len(chunk) > max_body_size:
+                    chunk = chunk[:max_body_size - size]
+                chunks.append(chunk)
+                size += len(chunk)
+                if not done and scanner is not None:
+                    done = scanner.feed(chunk)
+                if size >= max_body_size or (done and _remaining_bytes(response) > DRAIN_LIMIT):
+                    break
+    finally:
+        await response.aclose()
+        if scanner is not None:
+            scanner.finish()
+    response._content = b''.join(chunks)
+
 
 async def request_with_tactics(
         client: httpx.AsyncClient,
@@ -32,9 +165,26 @@ async def request_with_tactics(
         backoff: bool = False,
         TimeoutConfig: Optional[Dict[str, Any]] = None,
         retry_tatics: Optional[Dict[str, Any]] = None,
+        monitor: Any = None,
+        breaker: Optional[CircuitBreaker] = None,
+        max_body_size: Optional[int] = None,
+        scanner: Any = None,
 ) -> httpx.Response:
-    """发起异步请求"""
+    """
+    发起异步请求
+    monitor 请求结果观察者，每次尝试后调用monitor.record(url, 耗时, 状态码, 异常)
+    breaker 目标熔断器，目标处于熔断状态时直接返回None
+    max_body_size 设置后流式读取响应体，最多读取该字节数
+    scanner 流式读取时的增量规则评估器，见read_body
+    """
     attempt = 0
+    host = None
+    if breaker is not None:
+        try:
+            host = url_host(url)
+        except Exception:
+            # URL无法解析时交给build_request报错，不参与熔断
+            breaker = None
     common_args = {
             "method": method,
             "url": url,
@@ -49,21 +199,39 @@ async def request_with_tactics(
     # print(f"Requesting {common_args}")
     while True:
         attempt += 1
+        if breaker is not None and not breaker.allow(host):
+            return None
+        start_time = time.monotonic()
         try:
             request = client.build_request(**common_args)
             resp = await client.send(
                 request,
                 follow_redirects=False,
+                stream=max_body_size is not None,
             )
+            if monitor is not None:
+                monitor.record(request.url, time.monotonic() - start_time, resp.status_code)
+            if breaker is not None:
+                breaker.record_success(host)
             if resp.status_code in retry_tatics['StatusCodes']:
+                if max_body_size is not None:
+                    await resp.aclose()
                 await write_error_log(log_path, f"Retryable status {resp.status_code}", url)
                 raise httpx.HTTPStatusError(
                     f"Retryable status code: {resp.status_code}",
                     request=request,
                     response=resp
                 )
+            if max_body_size is not None:
+                await read_body(resp, max_body_size, scanner)
             return resp
         except Exception as e:
+            if monitor is not None and isinstance(e, httpx.TransportError):
+                monitor.record(url, time.monotonic() - start_time, None, e)
+            # 经代理访问时目标不可达表现为ProxyError(代理对CONNECT返回非2xx)，同样计入目标熔断
+            if breaker is not None and isinstance(e, (httpx.ConnectError, httpx.TimeoutException, httpx.ProxyError)):
+                if breaker.record_failure(host):
+                    await write_error_log(log_path, f"目标连续连接失败/超时，熔断{breaker.cooldown}s: {e!r}", url)
             if attempt >= max_attempts:
                 # print(f"Max retries exceeded: {e}")
                 # await write_error_log(log_path, f"Max retries exceeded({attempt}): {e}", url)
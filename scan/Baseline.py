@@ -0,0 +1,43 @@
+from typing import Callable, Dict, Optional, Tuple
+import asyncio
+import hashlib
+import uuid
+
+import httpx
+
+from scan.LogManager import write_error_log
+
+
+Signature = Tuple[int, int, str]
+
+
+def response_signature(response) -> Signature:
+    """响应签名: (状态码, 响应体长度, 响应体md5)"""
+    content = response.content
+    return response.status_code, len(content), hashlib.md5(content).hexdigest()
+
+
+async def baseline_targets(urls, client: httpx.AsyncClient, error_log, samples: int = 2,
+                           concurrency: int = 64, timeout: float = 5,
+                           get_headers: Optional[Callable[[str], Dict[str, str]]] = None) -> Dict[str, Optional[Signature]]:
+    """
+    请求每个目标若干个随机的不存在路径，记录兜底页面(soft-404/catch-all)的签名
+    所有随机路径的响应签名一致时才作为基线，否则该目标为None(不跳过规则检测)
+    get_headers 返回目标的请求头，与POC请求一致
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def baseline(url):
+        async with semaphore:
+            signatures = set()
+            for _ in range(max(1, samples)):
+                try:
+                    response = await client.get(f"{url}/{uuid.uuid4().hex}", timeout=timeout,
+                                                headers=get_headers(url) if get_headers is not None else None)
+                except Exception as e:
+                    await write_error_log(error_log, f"兜底页面基线请求失败，不跳过规则检测: {e!r}", url)
+                    return url, None
+                signatures.add(response_signature(response))
+            return url, signatures.pop() if len(signatures) == 1 else None
+
+    return dict(await asyncio.gather(*(baseline(url) for url in urls)))
@@ -1,4 +1,6 @@
 from scan import VerifyScanCFG as vscf
+from scan.ScanPlan import compile_rows
+from scan.Fingerprint import ensure_product_tags
 
 import re
 import sqlite3
@@ -25,9 +27,14 @@ class Tactics:
             if not proxy_valid:
                 return False, proxy_msg
             if self.skip_proxy_verify is False:
-                for i in proxy_msg['Proxy']["Addresses"]:
-                    if not vscf.verify_proxy(i):
-                        return False, f"Invalid proxies infomation address: {i}"
+                addresses = proxy_msg['Proxy']["Addresses"]
+                usable = vscf.verify_proxies(addresses)
+                if not usable:
+                    return False, f"Invalid proxies infomation address: {addresses}"
+                unusable = [i for i in addresses if i not in usable]
+                if unusable:
+                    print(f"以下代理不可用，已跳过: {unusable}")
+                proxy_msg['Proxy']["Addresses"] = usable
             cfg_data['Proxy'] = proxy_msg['Proxy']["Addresses"]
             cfg_data['EnableRotation'] = proxy_msg['Proxy']["EnableRotation"]
         else:
@@ -49,6 +56,7 @@ class Poc:
         self.use_poc_script = self.cfg_data['use_poc_script']
         self.skip_verify_cookie = self.cfg_data['skip_verify_cookie']
         self.skip_write_content = self.cfg_data['skip_write_content']
+        self.product_tags = self.cfg_data.get('product_tags') or []
 
     def get_pocid(self):
         other_args = ''
@@ -56,6 +64,11 @@ class Poc:
             other_args += 'AND need_cookie = 0 '
         if self.skip_write_content:
             other_args += 'AND write_content = 0 '
+        if self.product_tags:
+            # 未设置产品标签的通用POC始终执行
+            tags = [tag.strip().lower().replace("'", "") for tag in self.product_tags]
+            tag_clause = " OR ".join(f"(',' || product_tags || ',') LIKE '%,{tag},%'" for tag in tags)
+            other_args += f"AND (product_tags = '' OR {tag_clause}) "
 
         if "全量" in self.selected_pocs:
             select_poc_sql = f"SELECT poc_id FROM poc WHERE enabled = 1 {other_args}"
@@ -124,15 +137,29 @@ class Poc:
                     return self._consvert_list(poc_id), self._consvert_list(pocscript_id)
         return None, None
     
+    def get_poc_plans(self, poc_id: list):
+        """一次性查询并编译所选POC，返回(poc_id -> CompiledPoc, poc_id -> 编译错误信息)"""
+        conn_poc, cursor_poc = self._make_poc_conn()
+        rows = []
+        for i in range(0, len(poc_id), 500):
+            batch = poc_id[i:i + 500]
+            select_poc_sql = f"SELECT * FROM poc WHERE poc_id IN ({','.join('?' * len(batch))})"
+            rows.extend(cursor_poc.execute(select_poc_sql, batch).fetchall())
+        conn_poc.close()
+        return compile_rows(rows)
+
     def _make_poc_conn(self):
         conn_poc = sqlite3.connect('./data/db/poc.db')
+        ensure_product_tags(conn_poc, 'poc')
         cursor_poc = conn_poc.cursor()
         return conn_poc, cursor_poc
     
     def _make_pocscript_conn(self):
         conn_pocscript = sqlite3.connect('./data/db/pocscript.db')
+        ensure_product_tags(conn_pocscript, 'pocscript')
         cursor_pocscript = conn_pocscript.cursor()
         return conn_pocscript, cursor_pocscript
 
     def _consvert_list(self, poc_id: list):
-        return list(map(lambda x: x[0], poc_id))
\ No newline at end of file
+        return list(map(lambda x: x[0], poc_id))
+
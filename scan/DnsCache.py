@@ -0,0 +1,111 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+import asyncio
+import ipaddress
+import socket
+import time
+
+import httpcore
+import httpx
+
+from scan.AsyncRequest import wrap_network_backends
+
+
+# 域名不存在(NXDOMAIN)/没有记录时getaddrinfo返回的错误码
+NXDOMAIN_ERRORS = {socket.EAI_NONAME, getattr(socket, 'EAI_NODATA', socket.EAI_NONAME)}
+
+
+def is_nxdomain(error: BaseException) -> bool:
+    return isinstance(error, socket.gaierror) and error.errno in NXDOMAIN_ERRORS
+
+
+class DnsCache:
+    """
+    扫描期间共享的DNS缓存
+    同时缓存A/AAAA记录，过期前不再解析；同一主机的并发解析只发起一次
+    系统解析器不返回记录的TTL，缓存时间统一使用ttl
+    """
+
+    def __init__(self, ttl: float = 300, timeout: float = 3):
+        self.ttl = ttl
+        self.timeout = timeout
+        self.entries: Dict[str, Tuple[List[str], float]] = {}
+        self.pending: Dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def _is_ip(host: str) -> bool:
+        try:
+            ipaddress.ip_address(host)
+            return True
+        except ValueError:
+            return False
+
+    async def resolve(self, host: str) -> List[str]:
+        """返回主机的IP列表，解析失败时抛出socket.gaierror/asyncio.TimeoutError"""
+        if self._is_ip(host):
+            return [host]
+        entry = self.entries.get(host)
+        if entry is not None and entry[1] > time.monotonic():
+            return entry[0]
+        future = self.pending.get(host)
+        if future is None:
+            future = self.pending[host] = asyncio.ensure_future(self._lookup(host))
+            future.add_done_callback(lambda _: self.pending.pop(host, None))
+        return await asyncio.shield(future)
+
+    async def _lookup(self, host: str) -> List[str]:
+        loop = asyncio.get_running_loop()
+        infos = await asyncio.wait_for(
+            loop.getaddrinfo(host, None, type=socket.SOCK_STREAM),
+            self.timeout
+        )
+        ips = list(dict.fromkeys(info[4][0] for info in infos))
+        self.entries[host] = (ips, time.monotonic() + self.ttl)
+        return ips
+
+    async def resolve_all(self, hosts: Iterable[str], concurrency: int = 256) -> Dict[str, Optional[BaseException]]:
+        """并发解析所有主机，返回 主机 -> 解析错误(成功为None)"""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def resolve(host):
+            async with semaphore:
+                try:
+                    await self.resolve(host)
+                    return host, None
+                except Exception as e:
+                    return host, e
+
+        return dict(await asyncio.gather(*(resolve(host) for host in set(hosts))))
+
+    def attach(self, client: httpx.AsyncClient):
+        """让client的所有连接池(含代理)建立连接时通过缓存解析主机名"""
+        wrap_network_backends(client, lambda backend: CachedResolverBackend(self, backend), CachedResolverBackend)
+
+
+class CachedResolverBackend(httpcore.AsyncNetworkBackend):
+    """
+    httpcore网络后端，先从DnsCache取IP再建立TCP连接，依次尝试各个IP
+    TLS握手仍使用原主机名(SNI/证书校验不受影响)；解析失败时交给原后端解析
+    """
+
+    def __init__(self, cache: DnsCache, backend: httpcore.AsyncNetworkBackend):
+        self.cache = cache
+        self.backend = backend
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        try:
+            addresses = await self.cache.resolve(host)
+        except Exception:
+            addresses = [host]
+        error = None
+        for address in addresses:
+            try:
+                return await self.backend.connect_tcp(address, port, timeout, local_address, socket_options)
+            except httpcore.ConnectError as e:
+                error = e
+        raise error
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        return await self.backend.connect_unix_socket(path, timeout, socket_options)
+
+    async def sleep(self, seconds):
+        await self.backend.sleep(seconds)
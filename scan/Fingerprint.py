@@ -0,0 +1,123 @@
+from typing import Callable, Dict, FrozenSet, Optional
+import asyncio
+import hashlib
+import json
+
+import httpx
+
+from scan.AsyncRequest import read_body
+from scan.LogManager import write_error_log
+
+
+FINGERPRINT_PATH = "config/fingerprint.json"
+_LIBRARY = None
+
+
+def load_library() -> dict:
+    """
+    加载产品指纹库
+    每个产品包含: Keywords(用于从漏洞名称推断POC标签), Headers(响应头标记),
+    Body(响应体标记), Favicon(favicon.ico的md5)
+    """
+    global _LIBRARY
+    if _LIBRARY is None:
+        with open(FINGERPRINT_PATH, "r", encoding="utf-8") as f:
+            library = json.load(f)
+        _LIBRARY = {
+            tag: {
+                "Keywords": [k.lower() for k in item.get("Keywords", [])],
+                "Headers": [k.lower() for k in item.get("Headers", [])],
+                "Body": [k.lower() for k in item.get("Body", [])],
+                "Favicon": set(item.get("Favicon", [])),
+            }
+            for tag, item in library.items()
+        }
+    return _LIBRARY
+
+
+def infer_product_tags(vul_name: str) -> str:
+    """根据漏洞名称推断POC的产品标签，多个标签以逗号分隔"""
+    name = (vul_name or "").lower()
+    tags = [tag for tag, item in load_library().items()
+            if any(keyword in name for keyword in item["Keywords"])]
+    return ",".join(tags)
+
+
+def ensure_product_tags(conn, table):
+    """旧版数据库补充product_tags列，并根据漏洞名称推断已有POC的产品标签"""
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+    if "product_tags" in columns:
+        return
+    conn.execute(f"ALTER TABLE {table} ADD COLUMN product_tags TEXT DEFAULT ''")
+    rows = conn.execute(f"SELECT poc_id, vul_name FROM {table}").fetchall()
+    conn.executemany(f"UPDATE {table} SET product_tags = ? WHERE poc_id = ?",
+                     [(infer_product_tags(vul_name), poc_id) for poc_id, vul_name in rows])
+    conn.commit()
+
+
+def split_tags(product_tags: Optional[str]) -> FrozenSet[str]:
+    return frozenset(t.strip().lower() for t in (product_tags or "").split(",") if t.strip())
+
+
+def match_fingerprint(response: httpx.Response, favicon_hash: Optional[str] = None) -> FrozenSet[str]:
+    """匹配响应头、响应体标记和favicon哈希，返回命中的产品标签"""
+    headers_text = "\n".join(f"{k}: {v}" for k, v in response.headers.multi_items()).lower()
+    body = response.text.lower()
+    tags = set()
+    for tag, item in load_library().items():
+        if (any(marker in headers_text for marker in item["Headers"])
+                or any(marker in body for marker in item["Body"])
+                or (favicon_hash is not None and favicon_hash in item["Favicon"])):
+            tags.add(tag)
+    return frozenset(tags)
+
+
+async def fingerprint_targets(urls, client: httpx.AsyncClient, error_log, concurrency: int = 64,
+                              timeout: float = 5, get_headers: Optional[Callable[[str], Dict[str, str]]] = None,
+                              max_body_size: Optional[int] = None) -> Dict[str, Optional[FrozenSet[str]]]:
+    """
+    对每个目标发送一次基线请求识别产品
+    返回 url -> 产品标签集合，基线请求失败、状态码不是2xx/3xx(WAF拦截、登录、错误页等)
+    或未识别出任何产品的目标为None(不做POC裁剪)
+    指纹库中存在favicon哈希时额外请求/favicon.ico
+    get_headers 返回目标的请求头(与POC请求相同的用户请求头和User-Agent)
+    max_body_size 响应体最多读取的字节数，None表示完整读取
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    use_favicon = any(item["Favicon"] for item in load_library().values())
+
+    async def fetch(url, headers):
+        request = client.build_request("GET", url, headers=headers, timeout=timeout)
+        response = await client.send(request, follow_redirects=True, stream=True)
+        if max_body_size is None:
+            try:
+                await response.aread()
+            finally:
+                await response.aclose()
+        else:
+            await read_body(response, max_body_size)
+        return response
+
+    async def fingerprint(url):
+        async with semaphore:
+            headers = get_headers(url) if get_headers is not None else None
+            try:
+                response = await fetch(url + "/", headers)
+            except Exception as e:
+                await write_error_log(error_log, f"指纹识别失败，不裁剪POC: {e!r}", url)
+                return url, None
+            if not 200 <= response.status_code < 400:
+                await write_error_log(error_log, f"指纹识别请求返回{response.status_code}，不裁剪POC", url)
+                return url, None
+            favicon_hash = None
+            if use_favicon:
+                try:
+                    favicon = await fetch(url + "/favicon.ico", headers)
+                    if favicon.status_code == 200 and favicon.content:
+                        favicon_hash = hashlib.md5(favicon.content).hexdigest()
+                except Exception:
+                    pass
+            # 没有识别出任何产品时指纹未知，不裁剪POC
+            return url, match_fingerprint(response, favicon_hash) or None
+
+    return dict(await asyncio.gather(*(fingerprint(url) for url in urls)))
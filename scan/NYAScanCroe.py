@@ -1,28 +1,117 @@
 from scan.Constructor import Tactics, Poc
+from scan.ScanPlan import group_by_request
 from scan.LogManager import create_log_file, write_error_log, write_result_log
-from scan.AsyncRequest import make_async_client, request_with_tactics
-
-from fake_useragent import UserAgent
+from scan.AsyncRequest import CircuitBreaker, http2_available, make_async_client, request_with_tactics, url_host
+from scan.RuleMatcher import BodyScanner, ResponseView, catch_all_result, check_result
+from scan.Fingerprint import fingerprint_targets
+from scan.Baseline import baseline_targets, response_signature
+from scan.UserAgentPool import UserAgentPool
+from scan.DnsCache import DnsCache, is_nxdomain
+from scan.TlsContext import ssl_context
+from scan.Warmup import ConnectionWarmer
+from scan.SocketBudget import SocketBudget
+from scan.ProxyPool import (PROXY_POOL_CONFIG, ProxyHealthTransport, ProxyPool,
+                            load_health_cache, save_health_cache)
 
 from collections import deque
 import asyncio
-import aiosqlite
 import yaml
 import httpx
-import json
-import re
 import time
 import sqlite3
+import socket
 import importlib.util
 import sys
 import os
-import copy
 
 
 MAKE_CLIENT_CONFIG = {}
 RETRY_TACTICS = {}
+SCHEDULER_CONFIG = {
+    "MaxPerHost": 16,
+    "MaxPerIP": 32,
+    "ResolveTimeout": 3,
+}
+PROBE_CONFIG = {
+    "Enable": True,
+    "Method": "tcp",
+    "Timeout": 3,
+    "Concurrency": 256,
+}
+ADAPTIVE_CONFIG = {
+    "Enable": True,
+    "MaxScale": 1,
+    "MinConcurrency": 1,
+    "IncreaseStep": 2,
+    "DecreaseFactor": 0.5,
+    "Window": 20,
+    "ErrorRate": 0.1,
+    "LatencyFactor": 3,
+    "LatencyFloor": 1,
+    "OverloadStatusCodes": [429, 503],
+}
+# 视为目标过载的请求异常，其他异常(如代理隧道失败、连接被重置)不调整并发
+OVERLOAD_ERRORS = (httpx.TimeoutException, httpx.ConnectError)
+CONCURRENCY_CONTROLLER = None
+BREAKER_CONFIG = {
+    "Enable": True,
+    "FailureThreshold": 5,
+    "CooldownSeconds": 30,
+}
+CIRCUIT_BREAKER = None
+FINGERPRINT_CONFIG = {
+    "Enable": False,
+    "Timeout": 5,
+    "Concurrency": 64,
+}
+BASELINE_CONFIG = {
+    "Enable": True,
+    "Samples": 2,
+    "Timeout": 5,
+    "Concurrency": 64,
+}
+TARGET_BASELINE = {}
+USER_AGENT_CONFIG = {
+    "Strategy": "random",
+    "Fixed": "",
+}
+USER_AGENT_POOL = None
+DNS_CONFIG = {
+    "Enable": True,
+    "TTL": 300,
+    "Timeout": 3,
+    "Concurrency": 256,
+}
+DNS_CACHE = None
+WARMUP_CONFIG = {
+    "Enable": False,
+    "Mode": "jit",
+    "Connections": 2,
+    "Timeout": 5,
+    "Concurrency": 64,
+}
+CONNECTION_WARMER = None
+SOCKET_BUDGET_CONFIG = {
+    "Enable": True,
+    "Reserve": 128,
+    "PortUsage": 0.8,
+    "TimeWait": 60,
+    "WaitTimeout": 30,
+    "RaiseLimit": True,
+}
+SOCKET_BUDGET = None
+STREAM_CONFIG = {
+    "Enable": True,
+    "MaxBodySize": 1048576,
+    "RegexOverlap": 4096,
+}
+# 目标实际使用的HTTP协议版本: url -> {"HTTP/1.1", "HTTP/2", ...}
+TARGET_PROTOCOLS = {}
 MAX_CONCURRENCY = 0
-DB_POOL = None
+SCAN_PLAN = {}
+PLAN_ERRORS = {}
+# 进行中的二次请求: rq_url -> (发起时间, task)，请求完成后移除
+AGAIN_REQ_CACHE = {}
 
 def start_scan(cfg_data):
     try:
@@ -46,74 +135,18 @@ def start_scan(cfg_data):
             tactics = Tactics(cfg_data)
             scfg = tactics.cfg_data
             load_global_cfg()
-            global MAX_CONCURRENCY
-            if scfg['mode'] == 'ALONE':
-                MAX_CONCURRENCY = scfg['concurrency']
-            else:
-                MAX_CONCURRENCY = min(len(scfg['urls']), scfg['concurrency'])
             for i in range(len(scfg['urls'])):
                 if scfg['urls'][i][-1] == '/':
                     scfg['urls'][i] = scfg['urls'][i][:-1]
+            # 一次性加载并编译所有POC，扫描期间共享
+            global SCAN_PLAN, PLAN_ERRORS
+            SCAN_PLAN, PLAN_ERRORS = poc.get_poc_plans(poc_id)
+            # 发送相同请求的POC合并为一组，每个目标只请求一次
+            poc_groups = group_by_request(poc_id, SCAN_PLAN)
+            global MAX_CONCURRENCY
+            MAX_CONCURRENCY = min(len(scfg['urls']) * len(poc_groups), scfg['concurrency'])
 
-            # 根据代理配置生成client
-            if not scfg['enable_proxy'] or not scfg['EnableRotation']:
-                if scfg['Proxy'] is None or scfg['Proxy'][0] is None:
-                    proxy = None
-                else:
-                    proxy = scfg['Proxy'][0]
-                client = make_client(scfg, proxy)
-                if scfg['mode'] == 'ALONE':
-                    for url in scfg['urls']:
-                        asyncio.run(concurrency_tasks(poc_id, client,
-                                                    url, scfg['headers'], 
-                                                    scfg['enable_retry_backoff'], 
-                                                    scfg['max_retries'], None,"A",
-                                                    error_log, result_log))
-                if scfg['mode'] == 'GROUP':
-                    for pocid in poc_id:
-                        asyncio.run(concurrency_tasks(scfg['urls'], client,
-                                                    None, scfg['headers'], 
-                                                    scfg['enable_retry_backoff'], 
-                                                    scfg['max_retries'], pocid,'G',
-                                                    error_log, result_log))
-                asyncio.run(close_client(client))
-            else:
-                proxy_list = scfg['Proxy']
-                if not proxy_list:
-                    print("ERROR: 启用代理轮换但未提供代理列表")
-                    raise Exception("ERROR: 启用代理轮换但未提供代理列表")
-                proxy_index = 0
-                if scfg['mode'] == 'ALONE':
-                    for url in scfg['urls']:
-                        batch_split_num = MAX_CONCURRENCY
-                        if MAX_CONCURRENCY > len(poc_id):
-                            batch_split_num = len(poc_id)
-                        poc_batches = [poc_id[i:i + batch_split_num] for i in range(0, len(poc_id), batch_split_num)]
-                        print(f"{url}=={poc_batches}")
-                        for batch in poc_batches:
-                            current_proxy = proxy_list[proxy_index]
-                            client = make_client(scfg, current_proxy)
-                            asyncio.run(concurrency_tasks(batch, client,
-                                                url, scfg['headers'], 
-                                                scfg['enable_retry_backoff'], 
-                                                scfg['max_retries'], None,'A',
-                                                error_log, result_log))
-                            asyncio.run(close_client(client))
-                            proxy_index = (proxy_index + 1) % len(proxy_list)
-                            
-                if scfg['mode'] == 'GROUP':
-                    for pocid in poc_id:
-                        url_batches = [scfg['urls'][i:i + MAX_CONCURRENCY] for i in range(0, len(scfg['urls']), MAX_CONCURRENCY)]
-                        for batch in url_batches:
-                            current_proxy = proxy_list[proxy_index]
-                            client = make_client(scfg, current_proxy)
-                            asyncio.run(concurrency_tasks(batch, client,
-                                                None, scfg['headers'], 
-                                                scfg['enable_retry_backoff'], 
-                                                scfg['max_retries'], pocid,'G',
-                                                error_log, result_log))
-                            asyncio.run(close_client(client))
-                            proxy_index = (proxy_index + 1) % len(proxy_list)
+            asyncio.run(run_scan(poc_groups, scfg, error_log, result_log))
             print("POC执行结束")
         if pocscript:
             work_script(pocscript, cfg_data['urls'], cfg_data['mode'], error_log, result_log)
@@ -126,6 +159,523 @@ def start_scan(cfg_data):
             el.write(f"ERROR: {e}\n")
         return f"ERROR: {e}"
 
+async def run_scan(poc_groups, scfg, error_log, result_log):
+    """
+    在同一个事件循环中执行整个扫描
+    client由本协程统一创建、复用并在结束时关闭
+    """
+    global CONCURRENCY_CONTROLLER, CIRCUIT_BREAKER, USER_AGENT_POOL, DNS_CACHE, CONNECTION_WARMER
+    global SOCKET_BUDGET, MAX_CONCURRENCY
+    AGAIN_REQ_CACHE.clear()
+    TARGET_BASELINE.clear()
+    TARGET_PROTOCOLS.clear()
+    if MAKE_CLIENT_CONFIG.get('HTTP2') and not http2_available():
+        print("未安装h2(pip install httpx[http2])，HTTP/2未启用，使用HTTP/1.1")
+        MAKE_CLIENT_CONFIG['HTTP2'] = False
+    user_headers = {}
+    for i in scfg['headers']:
+        k, v = i.split(':', 1)
+        user_headers[k] = v.strip()
+    try:
+        if SOCKET_BUDGET_CONFIG['Enable']:
+            # 按文件描述符和本地端口数限制并发，连接数接近上限时新连接等待
+            SOCKET_BUDGET = SocketBudget.from_system(SOCKET_BUDGET_CONFIG['Reserve'],
+                                                     SOCKET_BUDGET_CONFIG['PortUsage'],
+                                                     SOCKET_BUDGET_CONFIG['TimeWait'],
+                                                     SOCKET_BUDGET_CONFIG['WaitTimeout'],
+                                                     SOCKET_BUDGET_CONFIG['RaiseLimit'])
+            if scfg['concurrency'] > SOCKET_BUDGET.capacity:
+                print(f"并发数{scfg['concurrency']}超过可用的文件描述符/本地端口数，调整为{SOCKET_BUDGET.capacity}")
+                scfg['concurrency'] = SOCKET_BUDGET.capacity
+                MAX_CONCURRENCY = min(MAX_CONCURRENCY, SOCKET_BUDGET.capacity)
+        USER_AGENT_POOL = UserAgentPool(USER_AGENT_CONFIG['Strategy'], USER_AGENT_CONFIG['Fixed'])
+        urls = scfg['urls']
+        if DNS_CONFIG['Enable']:
+            DNS_CACHE = DnsCache(DNS_CONFIG['TTL'], DNS_CONFIG['Timeout'])
+            # 使用代理时目标由代理解析，只缓存代理自身的地址
+            if not scfg['enable_proxy']:
+                urls = await preresolve_targets(urls, error_log)
+                if not urls:
+                    print("所有目标的域名均不存在")
+                    return
+        if PROBE_CONFIG['Enable']:
+            urls = await probe_targets(urls, scfg, error_log)
+            if not urls:
+                print("所有目标均不可达")
+                return
+        target_tags = {}
+        use_fingerprint = FINGERPRINT_CONFIG['Enable'] and any(plan.product_tags for plan in SCAN_PLAN.values())
+        if use_fingerprint or BASELINE_CONFIG['Enable']:
+            target_tags = await prepare_targets(urls, scfg, error_log, use_fingerprint, user_headers)
+        jobs = iter_jobs(urls, poc_groups, scfg['mode'], target_tags)
+        host_ips = await resolve_hosts(urls)
+        CONCURRENCY_CONTROLLER = AdaptiveConcurrency(MAX_CONCURRENCY,
+                                                     SCHEDULER_CONFIG['MaxPerHost'],
+                                                     len({url_host(url) for url in urls}))
+        if BREAKER_CONFIG['Enable']:
+            CIRCUIT_BREAKER = CircuitBreaker(BREAKER_CONFIG['FailureThreshold'],
+                                             BREAKER_CONFIG['CooldownSeconds'])
+        # 根据代理配置生成client池，每个代理一个长期复用的client
+        rotation = bool(scfg['enable_proxy'] and scfg['EnableRotation'])
+        if rotation:
+            proxy_list = scfg['Proxy']
+            if not proxy_list:
+                print("ERROR: 启用代理轮换但未提供代理列表")
+                raise Exception("ERROR: 启用代理轮换但未提供代理列表")
+        elif scfg['Proxy'] is None or scfg['Proxy'][0] is None:
+            proxy_list = [None]
+        else:
+            proxy_list = scfg['Proxy'][:1]
+        proxy_pool = None
+        if rotation:
+            # 轮换时跟踪每个代理的健康度，连续失败的代理暂时剔除
+            proxy_pool = ProxyPool(proxy_list,
+                                   load_health_cache(PROXY_POOL_CONFIG['CachePath'], PROXY_POOL_CONFIG['CacheTTL']),
+                                   PROXY_POOL_CONFIG['FailureThreshold'],
+                                   PROXY_POOL_CONFIG['EvictSeconds'])
+        clients = ClientPool(scfg, proxy_list, proxy_pool)
+        try:
+            if WARMUP_CONFIG['Enable']:
+                # 预热连接数不超过单个目标的并发上限
+                warmer = ConnectionWarmer(min(WARMUP_CONFIG['Connections'], SCHEDULER_CONFIG['MaxPerHost']),
+                                          WARMUP_CONFIG['Timeout'])
+                if WARMUP_CONFIG['Mode'] == 'ahead':
+                    # 任务按代理轮换client，每个目标在每个client上都预热
+                    await warmer.warm_all(urls, clients.all_clients(),
+                                          lambda url: build_headers({}, user_headers, USER_AGENT_POOL.get(url)),
+                                          WARMUP_CONFIG['Concurrency'])
+                else:
+                    CONNECTION_WARMER = warmer
+            await concurrency_tasks(jobs, clients, user_headers,
+                                    scfg['enable_retry_backoff'],
+                                    scfg['max_retries'],
+                                    error_log, result_log, host_ips)
+        finally:
+            await clients.aclose()
+            if proxy_pool is not None:
+                save_health_cache(PROXY_POOL_CONFIG['CachePath'], proxy_pool.health)
+            report_protocols(urls)
+    finally:
+        CONCURRENCY_CONTROLLER = None
+        CIRCUIT_BREAKER = None
+        USER_AGENT_POOL = None
+        DNS_CACHE = None
+        CONNECTION_WARMER = None
+        SOCKET_BUDGET = None
+        AGAIN_REQ_CACHE.clear()
+        TARGET_BASELINE.clear()
+        TARGET_PROTOCOLS.clear()
+
+def report_protocols(urls):
+    """输出每个目标实际使用的HTTP协议版本，没有收到任何响应的目标不输出"""
+    for url in urls:
+        versions = TARGET_PROTOCOLS.get(url)
+        if versions:
+            print(f"{url} 使用协议: {','.join(sorted(versions))}")
+
+async def preresolve_targets(urls, error_log):
+    """
+    扫描前并发解析所有目标的域名并写入DNS_CACHE，返回域名存在的目标
+    域名不存在(NXDOMAIN)的目标只记录一条错误日志，不再探测、分发POC
+    超时等其他解析错误不剔除目标，连接时再次解析
+    """
+    hosts = {httpx.URL(url).host for url in urls}
+    errors = await DNS_CACHE.resolve_all(hosts, DNS_CONFIG['Concurrency'])
+    kept = []
+    for url in urls:
+        error = errors.get(httpx.URL(url).host)
+        if error is not None and is_nxdomain(error):
+            print(f"目标域名不存在，跳过: {url}")
+            await write_error_log(error_log, f"目标域名不存在，已跳过所有POC: {error!r}", url)
+        else:
+            kept.append(url)
+    return kept
+
+async def probe_targets(urls, scfg, error_log):
+    """
+    扫描前并发探测目标存活，返回可达的目标
+    默认直接建立TCP连接；使用代理或Method为head时通过client发送HEAD请求，收到任意响应即视为存活
+    不可达的目标只记录一条错误日志，不再分发POC
+    """
+    timeout = PROBE_CONFIG['Timeout']
+    semaphore = asyncio.Semaphore(PROBE_CONFIG['Concurrency'])
+    use_head = PROBE_CONFIG['Method'] == 'head' or bool(scfg['enable_proxy'] and scfg['Proxy'])
+    client = None
+    if use_head:
+        client = make_client(scfg, scfg['Proxy'][0] if scfg['enable_proxy'] and scfg['Proxy'] else None)
+
+    async def connect(hostname, port):
+        """与open_connection(主机名)一样依次尝试主机的每个地址，任一地址连接成功即存活"""
+        addresses = [hostname]
+        if DNS_CACHE is not None:
+            addresses = await DNS_CACHE.resolve(hostname)
+        error = None
+        for address in addresses:
+            try:
+                _, writer = await asyncio.open_connection(address, port)
+            except OSError as e:
+                error = e
+                continue
+            writer.close()
+            await writer.wait_closed()
+            return
+        raise error
+
+    async def probe(host):
+        async with semaphore:
+            try:
+                if use_head:
+                    await client.head(hosts[host], timeout=timeout)
+                else:
+                    await asyncio.wait_for(connect(httpx.URL(hosts[host]).host, host.rsplit(':', 1)[1]), timeout)
+                return host, None
+            except Exception as e:
+                return host, e
+
+    hosts = {}
+    for url in urls:
+        hosts.setdefault(url_host(url), url)
+    try:
+        results = dict(await asyncio.gather(*(probe(host) for host in hosts)))
+    finally:
+        if client is not None:
+            await close_client(client)
+
+    alive = []
+    for url in urls:
+        error = results[url_host(url)]
+        if error is None:
+            alive.append(url)
+        else:
+            print(f"目标不可达，跳过: {url}")
+            await write_error_log(error_log, f"目标不可达，已跳过所有POC: {error!r}", url)
+    return alive
+
+async def prepare_targets(urls, scfg, error_log, use_fingerprint, user_headers=None):
+    """
+    扫描前的目标预处理，使用单独的client
+    请求头与POC请求一致: 用户请求头 + UserAgentPool提供的User-Agent
+    指纹识别: 返回 url -> 产品标签集合，识别失败的目标不裁剪POC
+    兜底页面基线: 记录到TARGET_BASELINE，与基线一致的POC响应不再评估本地规则
+    """
+    client = make_client(scfg, scfg['Proxy'][0] if scfg['enable_proxy'] and scfg['Proxy'] else None)
+    user_headers = user_headers or {}
+
+    def get_headers(url):
+        return build_headers({}, user_headers, USER_AGENT_POOL.get(url))
+
+    async def fingerprint():
+        if not use_fingerprint:
+            return {}
+        return await fingerprint_targets(urls, client, error_log,
+                                         FINGERPRINT_CONFIG['Concurrency'],
+                                         FINGERPRINT_CONFIG['Timeout'],
+                                         get_headers, body_limit())
+
+    async def baseline():
+        if not BASELINE_CONFIG['Enable']:
+            return {}
+        return await baseline_targets(urls, client, error_log,
+                                      BASELINE_CONFIG['Samples'],
+                                      BASELINE_CONFIG['Concurrency'],
+                                      BASELINE_CONFIG['Timeout'],
+                                      get_headers)
+
+    try:
+        target_tags, baselines = await asyncio.gather(fingerprint(), baseline())
+    finally:
+        await close_client(client)
+    TARGET_BASELINE.update((url, sig) for url, sig in baselines.items() if sig is not None)
+    for url, tags in target_tags.items():
+        if tags:
+            print(f"{url} 识别到产品: {','.join(sorted(tags))}")
+    return target_tags
+
+def applicable_pocs(pocs, tags):
+    """
+    按目标指纹裁剪POC组
+    未设置产品标签的POC总是执行；目标指纹未知(None或未识别出任何产品)时不裁剪
+    """
+    if not tags:
+        return pocs
+    return tuple(poc for poc in pocs
+                 if poc not in SCAN_PLAN
+                 or not SCAN_PLAN[poc].product_tags
+                 or SCAN_PLAN[poc].product_tags & tags)
+
+def iter_jobs(urls, poc_groups, mode, target_tags=None):
+    """
+    生成(url, POC组)任务流
+    ALONE/GROUP只决定任务在队列中的先后顺序
+    ALONE: 按目标依次排列POC
+    GROUP: 按POC依次排列目标
+    target_tags 目标指纹，与目标产品不符的POC不再分发
+    """
+    target_tags = target_tags or {}
+    if mode == 'GROUP':
+        pairs = ((url, pocs) for pocs in poc_groups for url in urls)
+    else:
+        pairs = ((url, pocs) for url in urls for pocs in poc_groups)
+    for url, pocs in pairs:
+        pocs = applicable_pocs(pocs, target_tags.get(url))
+        if pocs:
+            yield url, pocs
+
+async def resolve_hosts(urls):
+    """
+    并发解析所有目标的IP，用于按IP限流；解析失败的目标以主机名代替IP
+    启用DNS缓存时直接使用DNS_CACHE(已预解析的目标不再解析)
+    """
+    loop = asyncio.get_running_loop()
+    hosts = {httpx.URL(url).host for url in urls}
+
+    async def resolve(host):
+        try:
+            if DNS_CACHE is not None:
+                return host, (await DNS_CACHE.resolve(host))[0]
+            infos = await asyncio.wait_for(
+                loop.getaddrinfo(host, None, type=socket.SOCK_STREAM),
+                SCHEDULER_CONFIG['ResolveTimeout']
+            )
+            return host, infos[0][4][0]
+        except Exception:
+            return host, host
+
+    return dict(await asyncio.gather(*(resolve(host) for host in hosts)))
+
+class HostScheduler:
+    """
+    按主机/IP限流的任务调度器
+    全局并发由调用方控制，本类保证每个主机和每个IP的在途任务数不超过上限
+    暂时不能派发的任务按主机暂存，主机空出并发位后优先派发
+    """
+    MAX_PARKED = 50000
+
+    def __init__(self, jobs, max_per_host, max_per_ip, host_ips=None, host_limit=None):
+        self.jobs = iter(jobs)
+        self.max_per_host = max(1, max_per_host)
+        self.host_limit = host_limit
+        self.max_per_ip = max(1, max_per_ip)
+        self.host_ips = host_ips or {}
+        self.host_running = {}
+        self.ip_running = {}
+        self.ip_hosts = {}
+        self.parked = {}
+        self.parked_count = 0
+        self.running = 0
+        self.ready = deque()
+        self.exhausted = False
+        self._keys = {}
+
+    def _key(self, url):
+        key = self._keys.get(url)
+        if key is None:
+            host = url_host(url)
+            ip = self.host_ips.get(httpx.URL(url).host, host)
+            key = self._keys[url] = (host, ip)
+            self.ip_hosts.setdefault(ip, set()).add(host)
+        return key
+
+    def _has_slot(self, host, ip):
+        max_per_host = self.max_per_host
+        if self.host_limit is not None:
+            max_per_host = min(max_per_host, self.host_limit(host))
+        return (self.host_running.get(host, 0) < max_per_host
+                and self.ip_running.get(ip, 0) < self.max_per_ip)
+
+    def _acquire(self, host, ip):
+        self.running += 1
+        self.host_running[host] = self.host_running.get(host, 0) + 1
+        self.ip_running[ip] = self.ip_running.get(ip, 0) + 1
+
+    def next_job(self):
+        """取出一个可以立即执行的任务，没有则返回None"""
+        if not self.running and not self.ready:
+            self.ready.extend(self.parked)
+        while self.ready:
+            host = self.ready.popleft()
+            queue = self.parked.get(host)
+            if not queue:
+                continue
+            key = self._key(queue[0][0])
+            if not self._has_slot(*key):
+                continue
+            job = queue.popleft()
+            self.parked_count -= 1
+            if queue:
+                self.ready.append(host)
+            else:
+                del self.parked[host]
+            self._acquire(*key)
+            return job
+        while not self.exhausted and self.parked_count < self.MAX_PARKED:
+            job = next(self.jobs, None)
+            if job is None:
+                self.exhausted = True
+                break
+            key = self._key(job[0])
+            if key[0] not in self.parked and self._has_slot(*key):
+                self._acquire(*key)
+                return job
+            self.parked.setdefault(key[0], deque()).append(job)
+            self.parked_count += 1
+        return None
+
+    def release(self, job):
+        """任务结束，归还主机和IP的并发位"""
+        host, ip = self._key(job[0])
+        self.running -= 1
+        self.host_running[host] -= 1
+        self.ip_running[ip] -= 1
+        for h in self.ip_hosts[ip]:
+            if h in self.parked:
+                self.ready.append(h)
+
+    def empty(self):
+        return self.exhausted and self.parked_count == 0
+
+class _AimdWindow:
+    """AIMD统计窗口"""
+    def __init__(self, limit):
+        self.limit = limit
+        self.samples = 0
+        self.errors = 0
+        self.error_hosts = set()
+        self.latencies = []
+        self.baseline = None
+
+    def add(self, host, latency, failed):
+        self.samples += 1
+        if failed:
+            self.errors += 1
+            self.error_hosts.add(host)
+        else:
+            self.latencies.append((latency, host))
+
+    def reset(self):
+        self.samples = 0
+        self.errors = 0
+        self.error_hosts = set()
+        self.latencies = []
+
+class AdaptiveConcurrency:
+    """
+    AIMD并发控制器
+    观察request_with_tactics每次请求的延迟、超时/连接错误和限流状态码(OverloadStatusCodes)，
+    每满一个窗口调整一次全局和单主机并发：过载时乘性减小，否则加性增大
+    POC载荷常使正常的服务端返回500等错误，这类状态码不视为过载
+    单主机并发不超过MaxPerHost，全局并发不超过初始并发的MaxScale倍(默认1，即不超过配置的并发数)
+    """
+    def __init__(self, initial, max_per_host, host_count=1):
+        self.enabled = ADAPTIVE_CONFIG['Enable']
+        self.overload_codes = set(ADAPTIVE_CONFIG['OverloadStatusCodes'] or [])
+        self.min_limit = max(1, ADAPTIVE_CONFIG['MinConcurrency'])
+        self.max_limit = max(initial, int(initial * ADAPTIVE_CONFIG['MaxScale']))
+        if SOCKET_BUDGET is not None:
+            self.max_limit = min(self.max_limit, max(initial, SOCKET_BUDGET.capacity))
+        self.max_per_host = max(1, max_per_host)
+        self.host_count = host_count
+        self.global_window = _AimdWindow(initial)
+        self.host_windows = {}
+
+    @property
+    def limit(self):
+        return self.global_window.limit
+
+    def host_limit(self, host):
+        window = self.host_windows.get(host)
+        return window.limit if window else self.max_per_host
+
+    def record(self, url, latency, status=None, error=None):
+        """记录一次请求结果"""
+        if not self.enabled:
+            return
+        host = url_host(url)
+        failed = isinstance(error, OVERLOAD_ERRORS) or status in self.overload_codes
+        window = self.host_windows.get(host)
+        if window is None:
+            window = self.host_windows[host] = _AimdWindow(self.max_per_host)
+        window.add(host, latency, failed)
+        if window.samples >= ADAPTIVE_CONFIG['Window']:
+            if self._error_overload(window) or self._latency_overload(window):
+                window.limit = max(1, int(window.limit * ADAPTIVE_CONFIG['DecreaseFactor']))
+            else:
+                window.limit = min(self.max_per_host, window.limit + 1)
+            window.reset()
+
+        window = self.global_window
+        window.add(host, latency, failed)
+        if window.samples >= ADAPTIVE_CONFIG['Window']:
+            # 错误或高延迟集中在单个目标时只收紧该目标，不影响全局
+            bad_hosts = set(self._latency_overload(window))
+            if self._error_overload(window):
+                bad_hosts |= window.error_hosts
+            if len(bad_hosts) > 1 or (bad_hosts and self.host_count == 1):
+                window.limit = max(self.min_limit, int(window.limit * ADAPTIVE_CONFIG['DecreaseFactor']))
+            else:
+                window.limit = min(self.max_limit, window.limit + ADAPTIVE_CONFIG['IncreaseStep'])
+            window.reset()
+
+    def _error_overload(self, window):
+        """窗口内错误率过高"""
+        return window.errors > window.samples * ADAPTIVE_CONFIG['ErrorRate']
+
+    def _latency_overload(self, window):
+        """窗口内p90延迟明显高于历史最低p50时，返回超出阈值的主机"""
+        if not window.latencies:
+            return set()
+        latencies = sorted(window.latencies)
+        p50 = latencies[len(latencies) // 2][0]
+        p90 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.9))][0]
+        if window.baseline is None or p50 < window.baseline:
+            window.baseline = p50
+        threshold = max(ADAPTIVE_CONFIG['LatencyFloor'], window.baseline * ADAPTIVE_CONFIG['LatencyFactor'])
+        if p90 <= threshold:
+            return set()
+        return {host for latency, host in latencies if latency > threshold}
+
+class ClientPool:
+    """
+    按代理复用的client池
+    每个代理只创建一个长期存在的AsyncClient，扫描结束时统一关闭
+    多个代理时按任务轮换，同一任务(含二次请求)始终使用同一个client
+    proxy_pool 提供时由代理池选择代理(跳过被剔除的代理)，并记录每个代理的请求结果
+    """
+
+    def __init__(self, scfg, proxies, proxy_pool=None):
+        self.scfg = scfg
+        self.proxies = list(proxies) or [None]
+        self.proxy_pool = proxy_pool
+        self.clients = {}
+        self.index = 0
+
+    def get(self, proxy):
+        client = self.clients.get(proxy)
+        if client is None:
+            client = self.clients[proxy] = make_client(self.scfg, proxy, self.proxy_pool)
+        return client
+
+    def all_clients(self):
+        """next可能返回的所有client(代理池只取当前可用的代理)"""
+        if self.proxy_pool is not None:
+            proxies = self.proxy_pool.available() or self.proxy_pool.ranked()[:1]
+        else:
+            proxies = self.proxies
+        return [self.get(proxy) for proxy in proxies]
+
+    def next(self):
+        if self.proxy_pool is not None:
+            return self.get(self.proxy_pool.next())
+        proxy = self.proxies[self.index]
+        self.index = (self.index + 1) % len(self.proxies)
+        return self.get(proxy)
+
+    async def aclose(self):
+        clients = list(self.clients.values())
+        self.clients.clear()
+        for client in clients:
+            await close_client(client)
+
 async def close_client(client):
     try:
         await client.aclose()
@@ -133,134 +683,153 @@ async def close_client(client):
         if "Event loop is closed" in str(e):
             pass
 
-async def work_all(client, poc, url, header, backoff, max_attempts, error_log, result_log):
-    """POC库的检测"""
+async def work_all(client, pocs, url, header, backoff, max_attempts, error_log, result_log):
+    """
+    POC库的检测
+    pocs 发送相同请求的一组POC，每个payload只请求一次，组内各POC的规则分别评估同一个响应
+    """
+    poc = pocs[0]
+    active = list(pocs)
     try:
-        res =  await async_qurery_poc(poc)
-        r_header = {}
-        if header != []:
-            for i in header:
-                k, v = i.split(':')
-                r_header[k] = v.strip()
-        else:
-            r_header = None
-        r_header = parse_headers(res['request']['headers'] ,r_header, res['request']['data_type'])
-        
-        r_payloads = res['payload']['content'].split('\n')
-        if res['request']['path'][0] != '/':
-            r_url = url + '/' + res['request']['path']
-        else:
-            r_url = url + res['request']['path']
-        for i in r_payloads:
-            if i == '':
-                r_payloads.remove(i)
-        if r_payloads == []:
-            r_payloads = ['']
-        for pay in r_payloads:
-            w_url = r_url
-            w_header = copy.deepcopy(r_header)
-            w_body = res['request']['data']
-            if res['payload']['position'] == 'URL':
-                if len(pay) >= 1:
-                    if r_url[-1] == '/':
-                        if pay[0] == '/':
-                            w_url =r_url + pay[1:]
-                        else:
-                            w_url = r_url + pay
-                    else:
-                        w_url = r_url + pay
-            elif res['payload']['position'] == 'header' and "PAYLOAD" in res['request']['headers']:
-                for key,value in w_header.items():
-                    w_header[key] = value.replace('PAYLOAD', pay)
-            elif res['payload']['position'] == 'body' and "PAYLOAD" not in res['request']['data']:
-                w_body = res['request']['data'] + pay
-            elif res['payload']['position'] == 'body' and "PAYLOAD" in res['request']['data']:
-                w_body = w_body.replace('PAYLOAD', pay)
-
-            if len(res['rules']) < 2 and res['rules'][0]['type'] == 'time':
+        if CIRCUIT_BREAKER is not None and not CIRCUIT_BREAKER.available(url_host(url)):
+            raise Exception("目标处于熔断状态，跳过")
+        res = SCAN_PLAN.get(poc)
+        if res is None:
+            raise Exception(PLAN_ERRORS.get(poc, "Poc not found"))
+        # 组内所有POC都不需要响应体时，收到响应头即可判断，见BodyScanner/read_body
+        needs_body = any(SCAN_PLAN[p].needs_body for p in pocs)
+        user_agent = USER_AGENT_POOL.get(url)
+        if CONNECTION_WARMER is not None:
+            # 目标的第一批任务等待连接预热完成后再发送
+            await CONNECTION_WARMER.warm(client, url, build_headers({}, header, user_agent))
+        for prepared in res.requests:
+            # 请求模板已代入payload，只需拼接目标地址、合并请求头
+            w_url = url + prepared.path
+            w_header = build_headers(prepared.headers, header, user_agent, needs_body)
+            w_body = prepared.data
+
+            time_rule = res.rules[0]
+            if len(res.rules) < 2 and time_rule.type == 'time':
                 start_time = time.time()
                 resp = await request_with_tactics(
-                        client, res['request']['method'],w_url,error_log,
+                        client, res.method,w_url,error_log,
                         headers=w_header,data=w_body,
                         backoff=False,
                         max_attempts=1,
                         retry_tatics=RETRY_TACTICS,
-                        TimeoutConfig={"connect":max(MAKE_CLIENT_CONFIG['MaxConnectTimeout'],int(res['rules'][0]['val'])),
-                                        "read": max(MAKE_CLIENT_CONFIG['MaxReadTimeout'],int(res['rules'][0]['val'])),
-                                        "write": max(MAKE_CLIENT_CONFIG['MaxWriteTimeout'], int(res['rules'][0]['val'])),
+                        breaker=CIRCUIT_BREAKER,
+                        max_body_size=body_limit(),
+                        TimeoutConfig={"connect":max(MAKE_CLIENT_CONFIG['MaxConnectTimeout'],time_rule.number),
+                                        "read": max(MAKE_CLIENT_CONFIG['MaxReadTimeout'],time_rule.number),
+                                        "write": max(MAKE_CLIENT_CONFIG['MaxWriteTimeout'], time_rule.number),
                                         "pool": MAKE_CLIENT_CONFIG['MaxPoolDelay']
                                         }
                     )
                 use_time = time.time()-start_time
-                if res['rules'][0]['op'] in ['<', '>='] and use_time >= int(res['rules'][0]['val']):
-                    await write_result_log(result_log, "There is a security vulnerability", url, res['poc_name'], " ", poc, f"检测方式为时间检测: {res['rules'][0]['op']} {res['rules'][0]['val']}")
+                if time_rule.op in ['<', '>='] and use_time >= time_rule.number:
+                    await write_result_log(result_log, "There is a security vulnerability", url, res.poc_name, " ", poc, f"检测方式为时间检测: {time_rule.op} {time_rule.val}")
                     continue
-                if res['rules'][0]['op'] in ['>', '<='] and use_time < int(res['rules'][0]['val']):
-                    await write_result_log(result_log, "There is a security vulnerability", url, res['poc_name']," ", poc, f"检测方式为时间检测: {res['rules'][0]['op']} {res['rules'][0]['val']}")
+                if time_rule.op in ['>', '<='] and use_time < time_rule.number:
+                    await write_result_log(result_log, "There is a security vulnerability", url, res.poc_name," ", poc, f"检测方式为时间检测: {time_rule.op} {time_rule.val}")
                     continue
-                await write_result_log(result_log, "There is not a security vulnerability", url,res['poc_name']," ", poc, f"检测方式为时间检测: {res['rules'][0]['op']} {res['rules'][0]['val']}")
+                await write_result_log(result_log, "There is not a security vulnerability", url,res.poc_name," ", poc, f"检测方式为时间检测: {time_rule.op} {time_rule.val}")
                 continue
+            scanner = None
+            if STREAM_CONFIG['Enable']:
+                # 组内所有POC的规则一起增量评估，结论确定后停止读取响应体
+                scanner = BodyScanner([rule for plan_id in active for rule in SCAN_PLAN[plan_id].rules],
+                                      STREAM_CONFIG['RegexOverlap'], TARGET_BASELINE.get(url))
             resp = await request_with_tactics(
-                client, res['request']['method'],w_url,error_log,
+                client, res.method,w_url,error_log,
                 headers=w_header,data=w_body,
                 backoff=backoff,
                 max_attempts=max_attempts,
-                retry_tatics=RETRY_TACTICS
+                retry_tatics=RETRY_TACTICS,
+                monitor=CONCURRENCY_CONTROLLER,
+                breaker=CIRCUIT_BREAKER,
+                max_body_size=body_limit(),
+                scanner=scanner
                 )
-            for ru in res['rules']:
-                if ru['position'] == 'again_req':
-                    check_result_a =  await check_again_req(ru, url, client, error_log)
-                else:
-                    check_result_a =  check_result(ru,resp)
-                if check_result_a[0]:
-                    await write_result_log(result_log, "There is a security vulnerability", url, res['poc_name'], " ", poc, check_result_a[1], " ",check_result_a[2])
-                else:
-                    await write_result_log(result_log, "There is not a security vulnerability", url, res['poc_name'], " ", poc, check_result_a[1]," ",check_result_a[2])
-            continue
+            sent_time = time.monotonic()
+            if resp is not None:
+                TARGET_PROTOCOLS.setdefault(url, set()).add(resp.http_version)
+            if resp is None:
+                view = None
+            elif scanner is not None:
+                view = scanner.view
+            else:
+                view = ResponseView(resp)
+            baseline = TARGET_BASELINE.get(url)
+            catch_all = view is not None and baseline is not None and response_signature(resp) == baseline
+            for plan_id in list(active):
+                if not await check_plan(SCAN_PLAN[plan_id], view, sent_time, url, client, error_log, result_log, catch_all):
+                    active.remove(plan_id)
+            if not active:
+                return
           
     except Exception as e:
         print("work func error:", end=" ")
         print(e)
-        await write_error_log(error_log, url, f" POC INFO: {poc}",f"ERROR: {e}")
+        for poc in active:
+            await write_error_log(error_log, url, f" POC INFO: {poc}",f"ERROR: {e}")
         return 
 
-async def concurrency_tasks(task_queue, client, url, header, backoff, max_attempts, pocid, mode,error_log, result_log):
-    """流式处理"""
-    task_queue = deque(task_queue)
-    semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
-    await init_db_pool('poc')
-    async def run_task(client, poc, url, header, backoff, max_attempts, error_log, result_log):
-        async with semaphore:
-            await work_all(client, poc, url, header, backoff, max_attempts, error_log, result_log)
-
-    running_tasks = []
-    for _ in range(min(MAX_CONCURRENCY, len(task_queue))):
-        if task_queue and mode == "A":
-            task_id = task_queue.popleft()
-            task = asyncio.create_task(run_task(client, task_id, url, header, backoff, max_attempts, error_log, result_log))
-            running_tasks.append(task)
-        if task_queue and mode == "G":
-            task_id = task_queue.popleft()
-            task = asyncio.create_task(run_task(client, pocid, task_id, header, backoff, max_attempts, error_log, result_log))
-            running_tasks.append(task)
-    
-    while running_tasks:
-        done, pending = await asyncio.wait(running_tasks, return_when=asyncio.FIRST_COMPLETED)
-        running_tasks = list(pending)
-    
-        while len(running_tasks) < MAX_CONCURRENCY and task_queue:
-            if mode == 'A':
-                task_id = task_queue.popleft()
-                task = asyncio.create_task(run_task(client, task_id, url, header, backoff, max_attempts, error_log, result_log))
-                running_tasks.append(task)
-            if mode == 'G':
-                task_id = task_queue.popleft()
-                task = asyncio.create_task(run_task(client, pocid, task_id, header, backoff, max_attempts, error_log, result_log))
-                running_tasks.append(task)
-
-    if running_tasks:
-        await asyncio.gather(*running_tasks, return_exceptions=True)
-    await close_db_pool()
+async def check_plan(plan, resp, sent_time, url, client, error_log, result_log, catch_all=False):
+    """
+    用同一个响应评估一个POC的全部规则，出错时记录错误并返回False
+    sent_time POC请求完成的时间，二次请求只复用此后发起的结果
+    catch_all 响应与目标兜底页面一致，本地规则不依据正文判断(正则仍检查响应头)，二次请求规则照常检测
+    """
+    try:
+        results = plan.matcher.match(resp, catch_all)
+        again_index = [i for i, ru in enumerate(plan.rules) if ru.position == 'again_req']
+        if again_index:
+            # 同一POC的二次请求并发执行
+            again_results = await asyncio.gather(
+                *(check_again_req(plan.rules[i], url, client, error_log, sent_time) for i in again_index)
+            )
+            for i, check_result_a in zip(again_index, again_results):
+                results[i] = check_result_a
+        for check_result_a in results:
+            if check_result_a[0]:
+                await write_result_log(result_log, "There is a security vulnerability", url, plan.poc_name, " ", plan.poc_id, check_result_a[1], " ",check_result_a[2])
+            else:
+                await write_result_log(result_log, "There is not a security vulnerability", url, plan.poc_name, " ", plan.poc_id, check_result_a[1]," ",check_result_a[2])
+        return True
+    except Exception as e:
+        print("work func error:", end=" ")
+        print(e)
+        await write_error_log(error_log, url, f" POC INFO: {plan.poc_id}",f"ERROR: {e}")
+        return False
+
+async def concurrency_tasks(jobs, clients, header, backoff, max_attempts, error_log, result_log, host_ips=None):
+    """
+    流式处理(url, poc)任务
+    任一任务结束后立即从任务流补充，使并发位始终占满
+    并发数由CONCURRENCY_CONTROLLER动态调整，单个主机/IP的在途任务数受SCHEDULER_CONFIG限制
+    clients 按代理复用的client池，每个任务从池中轮换取一个client
+    """
+    controller = CONCURRENCY_CONTROLLER
+    scheduler = HostScheduler(jobs,
+                              SCHEDULER_CONFIG['MaxPerHost'],
+                              SCHEDULER_CONFIG['MaxPerIP'],
+                              host_ips,
+                              controller.host_limit if controller else None)
+    running_tasks = {}
+    while True:
+        limit = controller.limit if controller else MAX_CONCURRENCY
+        while len(running_tasks) < limit:
+            job = scheduler.next_job()
+            if job is None:
+                break
+            url, pocs = job
+            task = asyncio.create_task(work_all(clients.next(), pocs, url, header, backoff, max_attempts, error_log, result_log))
+            running_tasks[task] = job
+        if not running_tasks:
+            break
+        done, _ = await asyncio.wait(running_tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            scheduler.release(running_tasks.pop(task))
 
 def load_global_cfg():
     with open('config/networkother.yaml', 'r', encoding='utf-8') as file:
@@ -269,16 +838,51 @@ def load_global_cfg():
     global RETRY_TACTICS
     MAKE_CLIENT_CONFIG = data['MakeClientConfig']
     RETRY_TACTICS = data['Retry']
+    SCHEDULER_CONFIG.update(data.get('Scheduler') or {})
+    ADAPTIVE_CONFIG.update(data.get('Adaptive') or {})
+    PROBE_CONFIG.update(data.get('Probe') or {})
+    BREAKER_CONFIG.update(data.get('CircuitBreaker') or {})
+    FINGERPRINT_CONFIG.update(data.get('Fingerprint') or {})
+    BASELINE_CONFIG.update(data.get('Baseline') or {})
+    STREAM_CONFIG.update(data.get('Stream') or {})
+    USER_AGENT_CONFIG.update(data.get('UserAgent') or {})
+    DNS_CONFIG.update(data.get('DNS') or {})
+    WARMUP_CONFIG.update(data.get('Warmup') or {})
+    SOCKET_BUDGET_CONFIG.update(data.get('SocketBudget') or {})
+    PROXY_POOL_CONFIG.update(data.get('ProxyPool') or {})
+
+def pool_limits(scfg):
+    """
+    连接池限制，按调度器的并发上限推导
+    max_connections 全局并发可能达到的最大值(启用自适应并发时为MaxScale倍，不超过套接字预算)
+    max_keepalive_connections 每个目标保留与其并发上限(MaxPerHost)相同的空闲连接，总数不超过max_connections
+    keepalive_expiry 空闲连接保留时间，GROUP模式下同一目标的请求间隔较长，默认比httpx的5s更长
+    连接池本身不区分目标，单个目标的连接数由HostScheduler限制
+    """
+    max_connections = max(1, scfg['concurrency'])
+    if ADAPTIVE_CONFIG['Enable']:
+        max_connections = max(max_connections, int(max_connections * ADAPTIVE_CONFIG['MaxScale']))
+    if SOCKET_BUDGET is not None:
+        max_connections = min(max_connections, max(scfg['concurrency'], SOCKET_BUDGET.capacity))
+    host_count = len({url_host(url) for url in scfg['urls']}) or 1
+    per_host = max(1, min(SCHEDULER_CONFIG['MaxPerHost'], max_connections))
+    return httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=min(max_connections, per_host * host_count),
+        keepalive_expiry=MAKE_CLIENT_CONFIG.get('KeepaliveExpiry', 15)
+    )
 
-def make_client(scfg, proxy):
-    if scfg['concurrency'] == 1:
-        max_keep_alive_connections = 0
-    elif scfg['concurrency'] <= 10:
-        max_keep_alive_connections = 1
-    elif scfg['concurrency'] > 10:
-        max_keep_alive_connections = int(scfg['concurrency'] * MAKE_CLIENT_CONFIG['MaxKeepaliveConnectionsRatio'])
+def make_client(scfg, proxy, proxy_pool=None):
+    """proxy_pool 提供时通过ProxyHealthTransport发送请求，把请求结果记录到代理池"""
+    limits = pool_limits(scfg)
+    http2 = bool(MAKE_CLIENT_CONFIG.get('HTTP2', False)) and http2_available()
     proxies = None
-    if proxy:
+    transport = None
+    if proxy and proxy_pool is not None:
+        transport = ProxyHealthTransport(httpx.AsyncHTTPTransport(proxy=proxy, limits=limits, http2=http2,
+                                                                  verify=ssl_context(http2=http2)),
+                                         proxy_pool, proxy)
+    elif proxy:
         proxies = {
             "http://": proxy,
             "https://": proxy,
@@ -290,82 +894,38 @@ def make_client(scfg, proxy):
             write=MAKE_CLIENT_CONFIG['MaxWriteTimeout'],
             pool=MAKE_CLIENT_CONFIG['MaxPoolDelay']
             ),
-        limits=httpx.Limits(
-            max_connections=scfg['concurrency'],
-            max_keepalive_connections=max_keep_alive_connections
-            ),
-        proxies=proxies
+        limits=limits,
+        proxies=proxies,
+        transport=transport,
+        http2=http2
     )
+    # 先包装套接字预算再包装DNS缓存，预算按解析后的IP统计
+    if SOCKET_BUDGET is not None:
+        SOCKET_BUDGET.attach(client)
+    if DNS_CACHE is not None:
+        DNS_CACHE.attach(client)
     return client
 
-async def init_db_pool(dbname):
-    """初始化数据库连接池"""
-    global DB_POOL
-    DB_POOL = await aiosqlite.connect(f"data/db/{dbname}.db")
-
-async def close_db_pool():
-    """关闭数据库连接池"""
-    if DB_POOL:
-        await DB_POOL.close()
-
-def parse_headers(header_string, existing_headers=None, header_type=None):
-    """
-    解析headers
-    header_string POC内置的headers
-    existing_headers 上层传入的headers
-    header_type 请求头类型(辅助header_string)
-    """
-    if existing_headers is None:
-        existing_headers = {}
-    if len(existing_headers)<=1:
-        existing_headers = {}
-    if len(header_string) > 1:
-        lines = header_string.split('\n')
-        lines = list(filter(lambda item: item != "", lines))
-        for line in lines:
-            if ':' in line:
-                key, value = line.split(':', 1)
-                key = key.strip()
-                value = value.strip()
-                existing_headers[key] = value
-
-    if 'Content-Type' in header_string:
-        if header_type == 'raw':
-            existing_headers['Content-Type'] = 'text/plain'
-        elif header_type == 'json':
-            existing_headers['Content-Type'] = 'application/json'
-        elif header_type == 'xml':
-            existing_headers['Content-Type'] = 'application/xml'
-        elif header_type == 'form-data':
-            existing_headers['Content-Type'] = 'multipart/form-data'
-        elif header_type == 'x-www-form-urlencoded':
-            existing_headers['Content-Type'] = 'application/x-www-form-urlencoded'
-
-    if 'User-Agent' not in existing_headers:
-        existing_headers['User-Agent'] = UserAgent().random
-
-    for key, value in existing_headers.items():
-        existing_headers[key] = value.strip()
-
-    return existing_headers
-
-async def async_qurery_poc(id) -> dict:
-    """异步查询数据库"""
-    global DB_POOL
-    async with DB_POOL.execute(f"SELECT * FROM poc WHERE poc_id = ?", (id,)) as cursor:
-        res = await cursor.fetchone()
-        if res is None:
-            raise Exception("Poc not found")
-        res_dict = {
-                "poc_id": res[0],
-                "poc_name": res[1],
-                "vul_id": res[2],
-                "request": json.loads(res[9]),
-                "payload":  json.loads(res[10]),
-                "rules": json.loads(res[11])
-        }
-        return res_dict
-    
+def body_limit():
+    """流式读取时的响应体字节上限，未启用时返回None(完整读取)"""
+    return STREAM_CONFIG['MaxBodySize'] if STREAM_CONFIG['Enable'] else None
+
+def build_headers(poc_headers, user_headers, user_agent, needs_body=True):
+    """
+    合并请求头，每次返回新的dict
+    poc_headers 请求模板中的POC请求头(已预解析并代入payload)
+    user_headers 上层传入的headers
+    user_agent 请求头中没有User-Agent时使用，由UserAgentPool提供
+    needs_body 为False时(规则只看状态码/耗时)不请求压缩编码，未显式指定Accept-Encoding时使用identity
+    """
+    headers = dict(user_headers) if len(user_headers) > 1 else {}
+    headers.update(poc_headers)
+    if 'User-Agent' not in headers:
+        headers['User-Agent'] = user_agent
+    if not needs_body and not any(k.lower() == 'accept-encoding' for k in headers):
+        headers['Accept-Encoding'] = 'identity'
+    return headers
+
 def conn_script_db():
     conn = sqlite3.connect('./data/db/pocscript.db')
     cursor = conn.cursor()
@@ -386,87 +946,43 @@ def qurery_poc_script(id, cursor) -> dict:
     }
     return res_dict
 
-def check_result(rule, response):
-    """检查结果"""
-    msg = [f" 检测方式为 {rule['type']}:{rule['val']}"]
-    if response is None:
-        return False, msg, None
-    if rule['type'] == 'status':
-        response_status = response.status_code
-        if rule['op']=='==' and response_status == rule['val']:
-            return True, msg, rule['res_d']
-        if rule['op']=='!=' and response_status != rule['val']:
-            return True, msg, rule['res_d']
-        return False, msg, None
-
-    if rule['type'] == 'regex':
-        pattern = re.compile(rule['val'], re.MULTILINE)
-        if rule['op'] == '==' and pattern.search(str(response.text)):
-            print("[+] 匹配到结果")
-            print(f"[+] 匹配到结果: {rule['val']}")
-            print(f"响应内容: {response.text}")
-            return True, msg, rule['res_d']
-        if rule['op'] == '!=' and not pattern.search(str(response.text)):
-            return True, msg, rule['res_d']
-
-        if rule['op'] == '==' and pattern.search(str(response.content.decode())):
-            return True, msg, rule['res_d']
-        if rule['op'] == '!=' and not pattern.search(str(response.content.decode())):
-            return True, msg, rule['res_d']
-
-        if rule['op'] == '==':
-            headers_str = '\n'.join([f"{k}: {v}" for k, v in response.headers.items()])
-            if pattern.search(headers_str):
-                return True, msg, rule['res_d']
-        if rule['op'] == '!=':
-            headers_str = '\n'.join([f"{k}: {v}" for k, v in response.headers.items()])
-            if not pattern.search(headers_str):
-                return True, msg, rule['res_d']
-        return False, msg, None
-    
-    if rule['type'] == 'content':
-        val = int(rule['val'])
-        if response.status_code in [404 , 302, 301]:
-            return False, msg, f"不通过，因为status_code:{response.status_code}"
-        if rule['op'] == '==':
-            if len(response.text) == val or len(response.content.decode()) == val:
-                return True, msg, rule['res_d']
-            return False, msg, None
-        elif rule['op'] == '!=':
-            if len(response.text) != val or len(response.content.decode()) != val:
-                return True, msg, rule['res_d']
-            return False, msg, None
-        elif rule['op'] == '>':
-            if len(response.text) >val or len(response.content.decode()) > val:
-                return True, msg, rule['res_d']
-        elif rule['op'] == '<':
-            if len(response.text) < val or len(response.content.decode()) < val:
-                return True, msg, rule['res_d']
-        elif rule['op'] == '>=':
-            if len(response.text) >= val or len(response.content.decode()) >=val:
-                return True, msg, rule['res_d']
-        elif rule['op'] == '<=':
-            if len(response.text) <= val or len(response.content.decode()) <= val:
-                return True, msg, rule['res_d']
-        return False, msg, None
-    if rule['type'] == 'oob':
-        # oob检测逻辑暂时为空
-        return True, "检测方式为 OOB", rule['res_d']
-
-async def check_again_req(rule, url, client, error_log):
-    plit = rule['val'].split('@', 1)
-    val = plit[0]
-    rq_url = url + plit[1]
+async def check_again_req(rule, url, client, error_log, sent_time=0):
+    """
+    二次请求检测
+    同一目标同一路径进行中的二次请求在并发的规则/POC间共享，只复用在sent_time之后发起的请求，
+    避免复用POC请求之前的旧响应；请求完成后即从缓存移除，不保留响应
+    """
+    rq_url = url + rule.again_path
+    cached = AGAIN_REQ_CACHE.get(rq_url)
+    if cached is None or cached[0] < sent_time:
+        task = asyncio.ensure_future(fetch_again_req(url, rq_url, client, error_log))
+        cached = AGAIN_REQ_CACHE[rq_url] = (time.monotonic(), task)
+
+        def forget(_, entry=cached):
+            # 已被更晚发起的请求替换时保留新的
+            if AGAIN_REQ_CACHE.get(rq_url) is entry:
+                del AGAIN_REQ_CACHE[rq_url]
+
+        task.add_done_callback(forget)
+    response, catch_all = await asyncio.shield(cached[1])
+    if catch_all:
+        return catch_all_result(rule, response)
+    return check_result(rule, response)
+
+async def fetch_again_req(url, rq_url, client, error_log):
+    """
+    发起二次请求，返回(可在多个规则间共享的ResponseView, 是否与目标兜底页面一致)
+    """
     response = await request_with_tactics(
-                client, 'GET', rq_url, error_log, retry_tatics=RETRY_TACTICS
+                client, 'GET', rq_url, error_log, retry_tatics=RETRY_TACTICS,
+                monitor=CONCURRENCY_CONTROLLER,
+                breaker=CIRCUIT_BREAKER,
+                max_body_size=body_limit()
                 )
-    n_rule = {
-        "type": rule['type'],
-        "val": val,
-        'res_d': rule['res_d'],
-        'op': rule['op'],
-    }
-    return check_result(n_rule, response)
+    if response is None:
+        return None, False
+    baseline = TARGET_BASELINE.get(url)
+    return ResponseView(response), baseline is not None and response_signature(response) == baseline
 
 def work_script(poc_id: list, urls: list, mode: str,error_log, result_log):
     """处理脚本"""
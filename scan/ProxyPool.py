@@ -0,0 +1,216 @@
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterable, List, Optional
+import asyncio
+import json
+import os
+import ssl
+import time
+
+import httpx
+
+from scan.TlsContext import ssl_context
+
+
+PROXY_POOL_CONFIG = {
+    "Timeout": 10,
+    "Concurrency": 32,
+    "CachePath": "data/proxy_health.json",
+    "CacheTTL": 600,
+    "FailureThreshold": 3,
+    "EvictSeconds": 60,
+}
+VERIFY_UA = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+}
+# 视为代理本身故障的异常(无法连接到代理)，目标自身的读超时等不计入
+# 代理可用但目标不可达时代理对CONNECT返回非2xx(httpx.ProxyError)，属于目标故障
+PROXY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+
+
+def is_proxy_failure(error: BaseException) -> bool:
+    """是否是连接代理本身失败；经隧道与目标TLS握手失败同样抛出ConnectError，不计入代理"""
+    if not isinstance(error, PROXY_ERRORS):
+        return False
+    # httpx以raise ... from保留httpcore异常，httpcore的原始异常只在__context__中
+    cause = error.__cause__ or error.__context__
+    while cause is not None:
+        if isinstance(cause, ssl.SSLError):
+            return False
+        cause = cause.__cause__ or cause.__context__
+    return True
+
+
+@dataclass
+class ProxyHealth:
+    """代理健康度"""
+    latency: float = 0.0
+    successes: int = 0
+    failures: int = 0
+    consecutive_failures: int = 0
+    checked: float = 0.0
+    evicted_until: float = 0.0
+
+    @property
+    def success_rate(self) -> float:
+        total = self.successes + self.failures
+        return self.successes / total if total else 1.0
+
+    @property
+    def score(self) -> float:
+        """成功率越高、延迟越低得分越高"""
+        return self.success_rate / max(self.latency, 0.01)
+
+    def usable(self) -> bool:
+        """
+        验证/使用过程中至少成功过一次，且当前没有被剔除
+        连续失败的代理在剔除时间过后重新接纳(与ProxyPool.available一致)
+        """
+        return self.successes > 0 and self.evicted_until <= time.time()
+
+
+class ProxyPool:
+    """
+    代理池
+    按得分排序、轮换使用可用代理；连续失败达到阈值的代理暂时剔除，剔除时间过后重新加入
+    所有代理都被剔除时仍使用得分最高的代理，不中断扫描
+    """
+
+    def __init__(self, proxies: Iterable[str], health: Optional[Dict[str, ProxyHealth]] = None,
+                 failure_threshold: int = 3, evict_seconds: float = 60):
+        health = health or {}
+        self.health = {proxy: health.get(proxy) or ProxyHealth() for proxy in proxies}
+        self.failure_threshold = max(1, failure_threshold)
+        self.evict_seconds = evict_seconds
+        self.index = 0
+
+    def available(self) -> List[str]:
+        now = time.time()
+        return [proxy for proxy, health in self.health.items() if health.evicted_until <= now]
+
+    def ranked(self) -> List[str]:
+        return sorted(self.health, key=lambda proxy: self.health[proxy].score, reverse=True)
+
+    def next(self) -> str:
+        """轮换返回下一个可用代理"""
+        proxies = self.available()
+        if not proxies:
+            return self.ranked()[0]
+        proxy = proxies[self.index % len(proxies)]
+        self.index += 1
+        return proxy
+
+    def record(self, proxy: str, latency: float, error: Optional[BaseException] = None):
+        """记录一次经由代理的请求结果"""
+        health = self.health.get(proxy)
+        if health is None:
+            return
+        health.checked = time.time()
+        if error is None:
+            health.successes += 1
+            health.consecutive_failures = 0
+            health.evicted_until = 0.0
+            # 指数滑动平均
+            health.latency = latency if health.latency == 0 else health.latency * 0.8 + latency * 0.2
+            return
+        health.failures += 1
+        health.consecutive_failures += 1
+        if health.consecutive_failures >= self.failure_threshold:
+            if health.evicted_until <= time.time():
+                print(f"代理连续失败{health.consecutive_failures}次，暂时剔除{self.evict_seconds}s: {proxy}")
+            health.evicted_until = time.time() + self.evict_seconds
+
+
+class ProxyHealthTransport(httpx.AsyncBaseTransport):
+    """包装代理的transport，把每次请求的结果记录到ProxyPool"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, pool: ProxyPool, proxy: str):
+        self.transport = transport
+        self.pool = pool
+        self.proxy = proxy
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        start_time = time.monotonic()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except PROXY_ERRORS as e:
+            if is_proxy_failure(e):
+                self.pool.record(self.proxy, time.monotonic() - start_time, e)
+            raise
+        self.pool.record(self.proxy, time.monotonic() - start_time)
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+def load_health_cache(path: str, ttl: float) -> Dict[str, ProxyHealth]:
+    """读取未过期的代理健康度缓存"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    now = time.time()
+    cache = {}
+    for proxy, item in data.items():
+        try:
+            health = ProxyHealth(**item)
+        except TypeError:
+            continue
+        if now - health.checked <= ttl:
+            cache[proxy] = health
+    return cache
+
+
+def save_health_cache(path: str, health: Dict[str, ProxyHealth]):
+    """合并写入代理健康度缓存"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        data = {}
+    data.update({proxy: asdict(item) for proxy, item in health.items()})
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+
+
+async def check_proxies(proxies: Iterable[str], addresses: Iterable[str], timeout: float = 10,
+                        concurrency: int = 32) -> Dict[str, ProxyHealth]:
+    """
+    并发验证代理，每个代理并发请求所有验证地址
+    任一验证地址返回200/302即视为可用，延迟取成功请求中的最小值
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    addresses = list(addresses)
+
+    async def fetch(client, address):
+        start_time = time.monotonic()
+        try:
+            response = await client.get(address, headers=VERIFY_UA)
+        except Exception as e:
+            print(f"代理地址可用性测试失败，目标：{address}，错误信息：{e}")
+            return None
+        if response.status_code in (200, 302):
+            return time.monotonic() - start_time
+        return None
+
+    async def check(proxy):
+        async with semaphore:
+            async with httpx.AsyncClient(proxies={"http://": proxy, "https://": proxy},
+                                         timeout=timeout, verify=ssl_context(False)) as client:
+                latencies = [latency for latency in await asyncio.gather(
+                    *(fetch(client, address) for address in addresses)) if latency is not None]
+        health = ProxyHealth(checked=time.time())
+        if latencies:
+            health.latency = min(latencies)
+            health.successes = 1
+            print(f"代理地址可用性测试通过: Proxies = {proxy}")
+        else:
+            health.failures = 1
+            health.consecutive_failures = 1
+        return proxy, health
+
+    return dict(await asyncio.gather(*(check(proxy) for proxy in proxies)))
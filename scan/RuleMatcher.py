@@ -0,0 +1,261 @@
+from functools import lru_cache
+from typing import List, Optional, Sequence
+
+
+CATCH_ALL_NOTE = "响应与目标兜底页面(soft-404/catch-all)一致，跳过规则检测"
+# content规则对这些状态码直接判定为不通过，不需要响应体
+CONTENT_SKIP_STATUS = (404, 302, 301)
+
+
+@lru_cache(maxsize=64)
+def ascii_compatible(encoding: str) -> bool:
+    """编码是否兼容ASCII(纯ASCII内容的字节与解码后的字符一一对应)"""
+    try:
+        return b'\n:Az09'.decode(encoding) == '\n:Az09'
+    except (LookupError, UnicodeDecodeError):
+        return False
+
+
+class ResponseView:
+    """
+    响应的只读视图：正文按字节匹配，只有规则确实需要文本时才解码一次，响应头文本按需拼接
+    同一正则在正文/响应头上的搜索结果缓存在视图中，同组POC共享
+    """
+    __slots__ = ('response', '_text', '_headers_text', '_searches', '_bytes_ok')
+
+    def __init__(self, response):
+        self.response = response
+        self._text = None
+        self._headers_text = None
+        self._searches = {}
+        self._bytes_ok = None
+
+    @property
+    def status_code(self) -> int:
+        return self.response.status_code
+
+    @property
+    def content(self) -> bytes:
+        return self.response.content
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = self.response.text
+        return self._text
+
+    @property
+    def headers_text(self) -> str:
+        if self._headers_text is None:
+            self._headers_text = '\n'.join([f"{k}: {v}" for k, v in self.response.headers.items()])
+        return self._headers_text
+
+    @property
+    def bytes_ok(self) -> bool:
+        """正文为纯ASCII且编码兼容ASCII时，ASCII正则按字节匹配与按文本匹配结果一致"""
+        if self._bytes_ok is None:
+            self._bytes_ok = (ascii_compatible(self.response.encoding or 'utf-8')
+                              and self.content.isascii())
+        return self._bytes_ok
+
+    def search_body(self, rule) -> bool:
+        found = self._searches.get((rule.pattern, 'body'))
+        if found is None:
+            if rule.byte_pattern is not None and self.bytes_ok:
+                found = rule.byte_pattern.search(self.content) is not None
+            else:
+                found = rule.pattern.search(self.text) is not None
+            self._searches[(rule.pattern, 'body')] = found
+        return found
+
+    def search_headers(self, rule) -> bool:
+        found = self._searches.get((rule.pattern, 'headers'))
+        if found is None:
+            found = self._searches[(rule.pattern, 'headers')] = rule.pattern.search(self.headers_text) is not None
+        return found
+
+    def preset_body(self, pattern, found: bool):
+        """写入流式读取时得到的正文搜索结果"""
+        self._searches[(pattern, 'body')] = found
+
+
+class RuleMatcher:
+    """编译后的规则匹配器，对同一个响应一次性评估所有本地规则"""
+
+    def __init__(self, rules: Sequence):
+        self.rules = tuple(rules)
+
+    def match(self, response, catch_all: bool = False) -> List[Optional[tuple]]:
+        """
+        按规则顺序返回检测结果
+        again_req规则需要二次请求，对应位置为None
+        catch_all 响应与目标兜底页面一致时不依据状态码/正文判断，见catch_all_result
+        """
+        if response is None or isinstance(response, ResponseView):
+            view = response
+        else:
+            view = ResponseView(response)
+        results = []
+        for rule in self.rules:
+            if rule.position == 'again_req':
+                results.append(None)
+            elif catch_all:
+                results.append(catch_all_result(rule, view))
+            else:
+                results.append(check_result(rule, view))
+        return results
+
+
+class BodyScanner:
+    """
+    流式读取响应体时增量评估一组规则
+    正则在 上一块末尾overlap个字节 + 当前块 上搜索，跨度超过overlap的匹配可能遗漏
+    窗口前额外保留1个字节作为上下文并从其后开始搜索，^、\b等只在真实的行首/单词边界匹配
+    窗口为纯ASCII时直接按字节匹配，否则解码该窗口后按文本匹配
+    所有规则的结论与剩余内容无关时done为True，调用方可以停止读取
+    """
+
+    def __init__(self, rules: Sequence, overlap: int = 4096, baseline: Optional[tuple] = None):
+        self.rules = tuple(rule for rule in rules if rule.position != 'again_req')
+        self.overlap = overlap
+        self.baseline = baseline
+        self.view = None
+
+    def start(self, response) -> bool:
+        """收到响应头后调用(重试时重新调用)，返回是否已不需要响应体"""
+        self.view = ResponseView(response)
+        # 正文搜索结果未定的正则: pattern -> byte_pattern
+        self.pending = {}
+        self.found = set()
+        self.needs_full = False
+        for rule in self.rules:
+            if rule.type == 'regex':
+                # ==: 响应头命中即通过；!=: 响应头未命中即通过，否则取决于正文
+                in_headers = self.view.search_headers(rule)
+                if (rule.op == '==' and not in_headers) or (rule.op == '!=' and in_headers):
+                    self.pending[rule.pattern] = rule.byte_pattern
+            elif rule.type == 'content' and response.status_code not in CONTENT_SKIP_STATUS:
+                self.needs_full = True
+        self.searched = frozenset(self.pending)
+        # 状态码与兜底页面一致时需要读到超过基线长度才能排除catch-all
+        self.baseline_size = None
+        if self.baseline is not None and response.status_code == self.baseline[0]:
+            self.baseline_size = self.baseline[1]
+            # 未压缩时Content-Length就是正文长度，长度不同可直接排除catch-all
+            length = response.headers.get('Content-Length')
+            if ('Content-Encoding' not in response.headers and length is not None
+                    and length.isdigit() and int(length) != self.baseline_size):
+                self.baseline_size = None
+        self.size = 0
+        self.tail = b''
+        self.encoding = response.encoding or 'utf-8'
+        self.bytes_ok = ascii_compatible(self.encoding)
+        return self.done
+
+    @property
+    def done(self) -> bool:
+        if self.needs_full or self.pending:
+            return False
+        return self.baseline_size is None or self.size > self.baseline_size
+
+    def feed(self, chunk: bytes) -> bool:
+        """处理一块响应体，返回规则结论是否已确定"""
+        self.size += len(chunk)
+        if self.pending:
+            self._search(chunk, final=False)
+        return self.done
+
+    def finish(self):
+        """读取结束，把正文搜索结果写入视图"""
+        if self.pending:
+            self._search(b'', final=True)
+        for pattern in self.searched:
+            self.view.preset_body(pattern, pattern in self.found)
+
+    def _search(self, chunk: bytes, final: bool):
+        window = self.tail + chunk
+        # 窗口不是响应体开头时，第1个字节是上一窗口的上下文，只用于判断^、\b、后向断言
+        pos = 0 if self.size == len(window) else 1
+        use_bytes = self.bytes_ok and window.isascii()
+        text = None
+        for pattern, byte_pattern in list(self.pending.items()):
+            if use_bytes and byte_pattern is not None:
+                match = byte_pattern.search(window, pos)
+                size = len(window)
+            else:
+                if text is None:
+                    # 窗口两端被截断的多字节字符解码为替换字符，完整字符会出现在下一个窗口
+                    # 上下文字节单独解码，不会与后面的字节合并成字符
+                    text = (window[:pos].decode(self.encoding, errors='replace')
+                            + window[pos:].decode(self.encoding, errors='replace'))
+                match = pattern.search(text, pos)
+                size = len(text)
+            # 匹配到窗口末尾时结果可能随后续内容变化，留到下一块再判断
+            if match is not None and (final or match.end() < size):
+                del self.pending[pattern]
+                self.found.add(pattern)
+        self.tail = window[-(self.overlap + 1):]
+
+
+def catch_all_result(rule, response=None):
+    """
+    响应与目标兜底页面一致时的检测结果
+    兜底页面签名只包含状态码和正文，正则规则仍检查响应头，只跳过正文搜索
+    """
+    msg = [f" 检测方式为 {rule.type}:{rule.val}"]
+    if rule.type == 'regex' and response is not None:
+        in_headers = response.search_headers(rule)
+        if (rule.op == '==' and in_headers) or (rule.op == '!=' and not in_headers):
+            return True, msg, rule.res_d
+    return False, msg, CATCH_ALL_NOTE
+
+
+def check_result(rule, response):
+    """检查结果"""
+    msg = [f" 检测方式为 {rule.type}:{rule.val}"]
+    if response is None:
+        return False, msg, None
+    if rule.type == 'status':
+        response_status = response.status_code
+        if rule.op == '==' and response_status == rule.number:
+            return True, msg, rule.res_d
+        if rule.op == '!=' and response_status != rule.number:
+            return True, msg, rule.res_d
+        return False, msg, None
+
+    if rule.type == 'regex':
+        # 先查响应头，命中时无需搜索正文
+        if rule.op == '==':
+            if response.search_headers(rule):
+                return True, msg, rule.res_d
+            if response.search_body(rule):
+                print("[+] 匹配到结果")
+                print(f"[+] 匹配到结果: {rule.val}")
+                print(f"响应内容: {response.text}")
+                return True, msg, rule.res_d
+        if rule.op == '!=':
+            if not response.search_headers(rule) or not response.search_body(rule):
+                return True, msg, rule.res_d
+        return False, msg, None
+
+    if rule.type == 'content':
+        val = rule.number
+        if response.status_code in CONTENT_SKIP_STATUS:
+            return False, msg, f"不通过，因为status_code:{response.status_code}"
+        length = len(response.content)
+        if rule.op == '==' and length == val:
+            return True, msg, rule.res_d
+        if rule.op == '!=' and length != val:
+            return True, msg, rule.res_d
+        if rule.op == '>' and length > val:
+            return True, msg, rule.res_d
+        if rule.op == '<' and length < val:
+            return True, msg, rule.res_d
+        if rule.op == '>=' and length >= val:
+            return True, msg, rule.res_d
+        if rule.op == '<=' and length <= val:
+            return True, msg, rule.res_d
+        return False, msg, None
+    if rule.type == 'oob':
+        # oob检测逻辑暂时为空
+        return True, "检测方式为 OOB", rule.res_d
@@ -0,0 +1,229 @@
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Dict, FrozenSet, Mapping, Optional, Pattern, Tuple
+import json
+import re
+
+from scan.Fingerprint import split_tags
+from scan.RuleMatcher import RuleMatcher
+
+
+CONTENT_TYPES = {
+    'raw': 'text/plain',
+    'json': 'application/json',
+    'xml': 'application/xml',
+    'form-data': 'multipart/form-data',
+    'x-www-form-urlencoded': 'application/x-www-form-urlencoded',
+}
+
+# 需要响应体才能判断的规则类型，其余类型(status/time/oob)只看状态码或耗时
+BODY_RULE_TYPES = ('regex', 'content')
+
+
+@dataclass(frozen=True)
+class CompiledRule:
+    """编译后的检测规则"""
+    position: str
+    type: str
+    op: str
+    val: str
+    res_d: str
+    pattern: Optional[Pattern] = None
+    byte_pattern: Optional[Pattern] = None
+    number: Optional[int] = None
+    again_path: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class PreparedRequest:
+    """代入payload后的请求模板，发送时只需拼接目标地址并合并上层请求头"""
+    payload: str
+    path: str
+    headers: Mapping[str, str]
+    data: str
+
+
+@dataclass(frozen=True)
+class CompiledPoc:
+    """编译后的POC，整个扫描期间只读共享"""
+    poc_id: str
+    poc_name: str
+    vul_id: str
+    request: Mapping[str, Any]
+    method: str
+    path: str
+    headers: Mapping[str, str]
+    header_string: str
+    data: str
+    payload_position: str
+    payloads: Tuple[str, ...]
+    requests: Tuple[PreparedRequest, ...]
+    rules: Tuple[CompiledRule, ...]
+    matcher: RuleMatcher
+    product_tags: FrozenSet[str] = frozenset()
+    needs_body: bool = True
+
+
+def parse_header_lines(header_string: str, header_type: Optional[str] = None) -> Dict[str, str]:
+    """
+    解析POC内置的headers
+    header_type 请求头类型(辅助header_string)
+    """
+    headers = {}
+    if len(header_string) > 1:
+        for line in header_string.split('\n'):
+            if ':' in line:
+                key, value = line.split(':', 1)
+                headers[key.strip()] = value.strip()
+    if 'Content-Type' in header_string and header_type in CONTENT_TYPES:
+        headers['Content-Type'] = CONTENT_TYPES[header_type]
+    return headers
+
+
+def prepare_requests(path: str, headers: Dict[str, str], header_string: str, data: str,
+                     payload_position: str, payloads: Tuple[str, ...]) -> Tuple[PreparedRequest, ...]:
+    """
+    为每个payload预先生成请求模板
+    URL: payload拼接到路径后(路径以/结尾且payload以/开头时去掉一个/)
+    header: 替换请求头中的PAYLOAD
+    body: 替换请求体中的PAYLOAD，没有PAYLOAD时拼接到请求体后
+    """
+    prepared = []
+    for pay in payloads:
+        w_path = path
+        w_headers = headers
+        w_body = data
+        if payload_position == 'URL':
+            if len(pay) >= 1:
+                if path[-1] == '/' and pay[0] == '/':
+                    w_path = path + pay[1:]
+                else:
+                    w_path = path + pay
+        elif payload_position == 'header' and "PAYLOAD" in header_string:
+            w_headers = {key: value.replace('PAYLOAD', pay) for key, value in headers.items()}
+        elif payload_position == 'body' and "PAYLOAD" not in data:
+            w_body = data + pay
+        elif payload_position == 'body' and "PAYLOAD" in data:
+            w_body = data.replace('PAYLOAD', pay)
+        prepared.append(PreparedRequest(pay, w_path, MappingProxyType(w_headers), w_body))
+    return tuple(prepared)
+
+
+def compile_rule(rule: dict) -> CompiledRule:
+    """
+    编译单条规则：预编译正则，预转换数值，拆分二次请求路径
+    纯ASCII的正则额外编译一份字节版本，用于直接匹配纯ASCII的响应体
+    """
+    val = rule['val']
+    again_path = None
+    if rule['position'] == 'again_req':
+        plit = val.split('@', 1)
+        val = plit[0]
+        again_path = plit[1]
+    pattern = None
+    byte_pattern = None
+    number = None
+    if rule['type'] == 'regex':
+        pattern = re.compile(val, re.MULTILINE)
+        if val.isascii():
+            try:
+                byte_pattern = re.compile(val.encode('ascii'), re.MULTILINE)
+            except re.error:
+                # 部分转义(如\u)只能用于文本正则
+                byte_pattern = None
+    elif rule['type'] in ('status', 'content', 'time'):
+        number = int(val)
+    return CompiledRule(
+        position=rule['position'],
+        type=rule['type'],
+        op=rule['op'],
+        val=val,
+        res_d=rule['res_d'],
+        pattern=pattern,
+        byte_pattern=byte_pattern,
+        number=number,
+        again_path=again_path,
+    )
+
+
+def compile_poc(row: tuple) -> CompiledPoc:
+    """将poc表的一行编译为CompiledPoc"""
+    request = json.loads(row[9])
+    payload = json.loads(row[10])
+    rules = json.loads(row[11])
+
+    path = request['path']
+    if path[:1] != '/':
+        path = '/' + path
+    payloads = tuple(p for p in payload['content'].split('\n') if p != '')
+    if not payloads:
+        payloads = ('',)
+    compiled_rules = tuple(compile_rule(rule) for rule in rules)
+    headers = parse_header_lines(request['headers'], request['data_type'])
+    return CompiledPoc(
+        poc_id=row[0],
+        poc_name=row[1],
+        vul_id=row[2],
+        request=MappingProxyType(request),
+        method=request['method'],
+        path=path,
+        headers=MappingProxyType(headers),
+        header_string=request['headers'],
+        data=request['data'],
+        payload_position=payload['position'],
+        payloads=payloads,
+        requests=prepare_requests(path, headers, request['headers'], request['data'],
+                                  payload['position'], payloads),
+        rules=compiled_rules,
+        matcher=RuleMatcher(compiled_rules),
+        product_tags=split_tags(row[12] if len(row) > 12 else ''),
+        needs_body=any(rule.type in BODY_RULE_TYPES for rule in compiled_rules
+                       if rule.position != 'again_req'),
+    )
+
+
+def compile_rows(rows) -> Tuple[Dict[str, CompiledPoc], Dict[str, str]]:
+    """
+    批量编译POC
+    返回 (poc_id -> CompiledPoc, poc_id -> 编译错误信息)
+    """
+    plans = {}
+    errors = {}
+    for row in rows:
+        try:
+            plans[row[0]] = compile_poc(row)
+        except Exception as e:
+            errors[row[0]] = str(e)
+    return plans, errors
+
+
+def request_fingerprint(plan: CompiledPoc) -> Optional[tuple]:
+    """
+    请求指纹，指纹相同的POC发送完全相同的请求
+    时间检测依赖单独计时，不参与合并，返回None
+    """
+    if any(rule.type == 'time' for rule in plan.rules):
+        return None
+    return (
+        plan.method,
+        plan.path,
+        tuple(sorted(plan.headers.items())),
+        'PAYLOAD' in plan.header_string,
+        plan.data,
+        plan.payload_position,
+        plan.payloads,
+    )
+
+
+def group_by_request(poc_id: list, plans: Dict[str, CompiledPoc]) -> list:
+    """
+    按请求指纹合并POC，保持原有顺序
+    返回POC ID元组的列表，同一元组内的POC共享一次请求
+    """
+    groups = {}
+    for poc in poc_id:
+        plan = plans.get(poc)
+        fingerprint = request_fingerprint(plan) if plan is not None else None
+        key = fingerprint if fingerprint is not None else ('poc', poc)
+        groups.setdefault(key, []).append(poc)
+    return [tuple(group) for group in groups.values()]
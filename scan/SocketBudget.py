@@ -0,0 +1,204 @@
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+import asyncio
+import os
+import time
+
+import httpcore
+import httpx
+
+from scan.AsyncRequest import wrap_network_backends
+
+try:
+    import resource
+except ImportError:
+    # Windows没有resource模块，不限制文件描述符
+    resource = None
+
+
+# 读取不到本地端口范围时使用IANA动态端口范围(49152-65535，Windows默认值)
+DEFAULT_PORT_RANGE = 16384
+
+
+def fd_limit(raise_limit: bool = True) -> Optional[int]:
+    """
+    返回进程可打开的文件描述符数(RLIMIT_NOFILE软限制)，无法读取时返回None
+    raise_limit 软限制低于硬限制时先提高到硬限制
+    """
+    if resource is None:
+        return None
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if raise_limit and soft != hard and hard != resource.RLIM_INFINITY:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+            soft = hard
+        except (ValueError, OSError):
+            pass
+    return None if soft == resource.RLIM_INFINITY else soft
+
+
+def open_fd_count() -> int:
+    """当前已打开的文件描述符数，无法读取时返回0"""
+    for path in ('/proc/self/fd', '/dev/fd'):
+        try:
+            return len(os.listdir(path))
+        except OSError:
+            continue
+    return 0
+
+
+def local_port_count() -> int:
+    """本地临时端口数量(ip_local_port_range)"""
+    try:
+        with open('/proc/sys/net/ipv4/ip_local_port_range', 'r') as f:
+            low, high = map(int, f.read().split())
+        return high - low + 1
+    except (OSError, ValueError):
+        return DEFAULT_PORT_RANGE
+
+
+class SocketBudget:
+    """
+    套接字预算，在耗尽之前而不是出现EMFILE/EADDRNOTAVAIL之后限流
+    fd_budget 同时打开的连接数上限(None表示不限制)
+    port_budget 对同一目标地址(ip:port)，打开的连接数与time_wait秒内关闭(处于TIME_WAIT)的连接数之和的上限
+    达到上限时新连接等待已有连接关闭/TIME_WAIT结束，最多等待wait_timeout秒后照常连接
+    """
+
+    def __init__(self, fd_budget: Optional[int], port_budget: int, time_wait: float = 60,
+                 wait_timeout: float = 30):
+        self.fd_budget = fd_budget
+        self.port_budget = max(1, port_budget)
+        self.time_wait = time_wait
+        self.wait_timeout = wait_timeout
+        self.open = 0
+        self.peak = 0
+        self.open_by_dest: Dict[Tuple[str, int], int] = {}
+        self.closed_by_dest: Dict[Tuple[str, int], Deque[float]] = {}
+        self.condition = asyncio.Condition()
+
+    @classmethod
+    def from_system(cls, reserve: int = 128, port_usage: float = 0.8, time_wait: float = 60,
+                    wait_timeout: float = 30, raise_limit: bool = True) -> 'SocketBudget':
+        """按RLIMIT_NOFILE(扣除已打开的和预留的描述符)和本地端口范围生成预算"""
+        limit = fd_limit(raise_limit)
+        fd_budget = None if limit is None else max(1, limit - open_fd_count() - reserve)
+        return cls(fd_budget, int(local_port_count() * port_usage), time_wait, wait_timeout)
+
+    @property
+    def capacity(self) -> int:
+        """同时打开的连接数上限，用于限制扫描并发"""
+        if self.fd_budget is None:
+            return self.port_budget
+        return min(self.fd_budget, self.port_budget)
+
+    def _dest_usage(self, dest) -> int:
+        closed = self.closed_by_dest.get(dest)
+        if closed:
+            expired = time.monotonic() - self.time_wait
+            while closed and closed[0] < expired:
+                closed.popleft()
+            if not closed:
+                del self.closed_by_dest[dest]
+        return self.open_by_dest.get(dest, 0) + (len(closed) if closed else 0)
+
+    def _has_room(self, dest) -> bool:
+        if self.fd_budget is not None and self.open >= self.fd_budget:
+            return False
+        return self._dest_usage(dest) < self.port_budget
+
+    async def acquire(self, dest: Tuple[str, int]):
+        async with self.condition:
+            deadline = time.monotonic() + self.wait_timeout
+            while not self._has_room(dest):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    # TIME_WAIT到期不会触发通知，定期重新检查
+                    await asyncio.wait_for(self.condition.wait(), min(remaining, 1))
+                except asyncio.TimeoutError:
+                    pass
+            self.open += 1
+            self.peak = max(self.peak, self.open)
+            self.open_by_dest[dest] = self.open_by_dest.get(dest, 0) + 1
+
+    async def release(self, dest: Tuple[str, int], connected: bool = True):
+        """connected 连接已建立(关闭后进入TIME_WAIT)"""
+        async with self.condition:
+            self.open -= 1
+            count = self.open_by_dest.get(dest, 0) - 1
+            if count > 0:
+                self.open_by_dest[dest] = count
+            else:
+                self.open_by_dest.pop(dest, None)
+            if connected:
+                self.closed_by_dest.setdefault(dest, deque()).append(time.monotonic())
+            # 等待者的目标地址各不相同，全部唤醒后各自重新检查
+            self.condition.notify_all()
+
+    def attach(self, client: httpx.AsyncClient):
+        """client的所有连接池(含代理)建立连接前占用预算，连接关闭时归还"""
+        wrap_network_backends(client, lambda backend: BudgetBackend(self, backend), BudgetBackend)
+
+
+class BudgetStream(httpcore.AsyncNetworkStream):
+    """关闭时归还预算的网络流，TLS升级后仍是同一个连接"""
+
+    def __init__(self, stream: httpcore.AsyncNetworkStream, budget: SocketBudget, dest: Tuple[str, int]):
+        self.stream = stream
+        self.budget = budget
+        self.dest = dest
+        self.closed = False
+
+    async def read(self, max_bytes, timeout=None):
+        return await self.stream.read(max_bytes, timeout)
+
+    async def write(self, buffer, timeout=None):
+        await self.stream.write(buffer, timeout)
+
+    async def aclose(self):
+        try:
+            await self.stream.aclose()
+        finally:
+            if not self.closed:
+                self.closed = True
+                await self.budget.release(self.dest)
+
+    async def start_tls(self, ssl_context, server_hostname=None, timeout=None):
+        try:
+            self.stream = await self.stream.start_tls(ssl_context, server_hostname, timeout)
+        except BaseException:
+            # 握手失败时底层流已被关闭，不会再调用aclose，在此归还预算
+            if not self.closed:
+                self.closed = True
+                await self.budget.release(self.dest)
+            raise
+        return self
+
+    def get_extra_info(self, info):
+        return self.stream.get_extra_info(info)
+
+
+class BudgetBackend(httpcore.AsyncNetworkBackend):
+    """httpcore网络后端，建立TCP连接前从SocketBudget占用预算"""
+
+    def __init__(self, budget: SocketBudget, backend: httpcore.AsyncNetworkBackend):
+        self.budget = budget
+        self.backend = backend
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        dest = (host, port)
+        await self.budget.acquire(dest)
+        try:
+            stream = await self.backend.connect_tcp(host, port, timeout, local_address, socket_options)
+        except BaseException:
+            await self.budget.release(dest, connected=False)
+            raise
+        return BudgetStream(stream, self.budget, dest)
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        return await self.backend.connect_unix_socket(path, timeout, socket_options)
+
+    async def sleep(self, seconds):
+        await self.backend.sleep(seconds)
@@ -0,0 +1,65 @@
+from functools import lru_cache
+from typing import Optional, Union
+import ssl
+
+import httpx
+
+
+# 每个SSLContext最多保存的TLS会话数(按主机名)
+SESSION_CACHE_SIZE = 4096
+
+
+class ResumableSSLObject(ssl.SSLObject):
+    """
+    客户端连接复用同一主机上次握手得到的TLS会话，重连时省去完整握手
+    TLS1.3的会话票据在握手之后才到达，读取数据时再保存
+    """
+
+    @classmethod
+    def _create(cls, incoming, outgoing, server_side=False, server_hostname=None, session=None, context=None):
+        sessions = getattr(context, 'tls_sessions', None)
+        if session is None and not server_side and server_hostname and sessions is not None:
+            session = sessions.get(server_hostname)
+        obj = super()._create(incoming, outgoing, server_side, server_hostname, session, context)
+        obj._session_saved = server_side or sessions is None
+        return obj
+
+    def _save_session(self):
+        session = self.session
+        if session is None:
+            return
+        # TLS1.2的会话ID/票据握手后即可复用，TLS1.3需等到收到票据
+        if session.has_ticket or self.version() != 'TLSv1.3':
+            sessions = self.context.tls_sessions
+            sessions.pop(self.server_hostname, None)
+            sessions[self.server_hostname] = session
+            if len(sessions) > SESSION_CACHE_SIZE:
+                sessions.pop(next(iter(sessions)))
+            self._session_saved = True
+
+    def do_handshake(self):
+        super().do_handshake()
+        if not self._session_saved:
+            self._save_session()
+
+    def read(self, len=1024, buffer=None):
+        data = super().read(len, buffer)
+        if not self._session_saved:
+            self._save_session()
+        return data
+
+
+@lru_cache(maxsize=None)
+def ssl_context(verify: Union[bool, str] = True, ciphers: Optional[str] = None,
+                http2: bool = False) -> ssl.SSLContext:
+    """
+    进程内共享的SSLContext，按(证书校验, 加密套件, 是否协商HTTP/2)缓存
+    证书包只加载一次，所有client共用，并按主机名复用TLS会话
+    verify 同httpx的verify: True/False/CA证书包路径
+    """
+    context = httpx.create_ssl_context(verify=verify, http2=http2)
+    if ciphers:
+        context.set_ciphers(ciphers)
+    context.tls_sessions = {}
+    context.sslobject_class = ResumableSSLObject
+    return context
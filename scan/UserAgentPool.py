@@ -0,0 +1,43 @@
+from typing import Dict, Optional
+import random
+
+from fake_useragent import UserAgent
+
+
+class UserAgentPool:
+    """
+    扫描期间共享的User-Agent池，fake_useragent的数据只加载、过滤一次
+    strategy:
+        random 每个请求随机选择
+        sticky 同一目标固定使用一个随机选择的User-Agent
+        fixed  所有请求使用同一个User-Agent(fixed为空时随机选择一个)
+    """
+    STRATEGIES = ('random', 'sticky', 'fixed')
+
+    def __init__(self, strategy: str = 'random', fixed: Optional[str] = None):
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"未知的User-Agent策略: {strategy}")
+        ua = UserAgent()
+        # 与UserAgent().random使用相同的过滤条件
+        self.agents = [
+            item['useragent'] for item in ua.data_browsers
+            if item['browser'] in ua.browsers
+            and item['os'] in ua.os
+            and item['type'] in ua.platforms
+            and item['browser_version_major_minor'] >= ua.min_version
+            and item['percent'] >= ua.min_percentage
+        ] or [ua.fallback]
+        self.strategy = strategy
+        self.fixed = fixed or random.choice(self.agents)
+        self.sticky: Dict[str, str] = {}
+
+    def get(self, target: Optional[str] = None) -> str:
+        """返回本次请求使用的User-Agent，target为扫描目标"""
+        if self.strategy == 'fixed':
+            return self.fixed
+        if self.strategy == 'sticky' and target is not None:
+            agent = self.sticky.get(target)
+            if agent is None:
+                agent = self.sticky[target] = random.choice(self.agents)
+            return agent
+        return random.choice(self.agents)
@@ -2,8 +2,11 @@
 import httpx
 import re
 import json
+import yaml
+import asyncio
 
 from pageother.SQLManager import verify_pocid
+from scan.ProxyPool import PROXY_POOL_CONFIG, check_proxies, load_health_cache, save_health_cache
 
 
 VERIFY_ADDRESS = []
@@ -134,26 +137,21 @@ def start_proxy()->tuple:
     print("代理配置检查通过")
     return True, proxy_cfg
 
-def verify_proxy(proxies: str):
-    print("正在检查代理地址可用性...")
-    proxy = {
-        "http://": proxies,
-        "https://": proxies
-    }
-    urls = VERIFY_ADDRESS
-    resp = []
-    ua = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-    }
-    for i in urls:
-        try:
-            print(f"正在检查代理地址可用性，目标：{i}")
-            response = httpx.get(i, proxies=proxy, headers=ua, timeout=10, verify=False)
-            resp.append(response.status_code)
-        
-        except Exception as e:
-            print(f"代理地址可用性测试失败，错误信息：{e}")   
-    if 200 in resp or 302 in resp:
-        print(f"代理地址可用性测试通过: Proxies = {proxies}")
-        return True
-    return False 
\ No newline at end of file
+def verify_proxies(proxies: list) -> list:
+    """
+    并发验证所有代理，返回可用的代理(按延迟和成功率得分从高到低排序)
+    缓存有效期内验证/使用过且仍可用的代理直接使用缓存结果；验证失败或被剔除的代理重新验证
+    """
+    with open('config/networkother.yaml', 'r', encoding='utf-8') as file:
+        PROXY_POOL_CONFIG.update((yaml.safe_load(file) or {}).get('ProxyPool') or {})
+    health = load_health_cache(PROXY_POOL_CONFIG['CachePath'], PROXY_POOL_CONFIG['CacheTTL'])
+    unchecked = [i for i in proxies if i not in health or not health[i].usable()]
+    if unchecked:
+        print(f"正在并发检查{len(unchecked)}个代理地址可用性...")
+        checked = asyncio.run(check_proxies(unchecked, VERIFY_ADDRESS,
+                                            PROXY_POOL_CONFIG['Timeout'],
+                                            PROXY_POOL_CONFIG['Concurrency']))
+        save_health_cache(PROXY_POOL_CONFIG['CachePath'], checked)
+        health.update(checked)
+    usable = [i for i in proxies if health[i].usable()]
+    return sorted(usable, key=lambda i: health[i].score, reverse=True)
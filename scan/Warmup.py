@@ -0,0 +1,45 @@
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import asyncio
+
+import httpx
+
+from scan.AsyncRequest import url_host
+
+
+class ConnectionWarmer:
+    """
+    目标连接预热
+    每个client对每个目标(host:port)只预热一次：并发发送connections个HEAD请求，
+    建立的keep-alive连接留在client的连接池中供随后的POC请求复用
+    同时到达的请求等待同一次预热完成；预热失败不影响扫描
+    能保留的连接数受client的max_keepalive_connections和keepalive_expiry限制
+    """
+
+    def __init__(self, connections: int = 2, timeout: float = 5):
+        self.connections = max(1, connections)
+        self.timeout = timeout
+        self.tasks: Dict[Tuple[int, str], asyncio.Future] = {}
+
+    async def warm(self, client: httpx.AsyncClient, url: str, headers: Optional[Dict[str, str]] = None):
+        key = (id(client), url_host(url))
+        task = self.tasks.get(key)
+        if task is None:
+            task = self.tasks[key] = asyncio.ensure_future(self._warm(client, url, headers))
+        await asyncio.shield(task)
+
+    async def _warm(self, client, url, headers):
+        await asyncio.gather(
+            *(client.head(url, headers=headers, timeout=self.timeout) for _ in range(self.connections)),
+            return_exceptions=True
+        )
+
+    async def warm_all(self, urls: Iterable[str], clients: List[httpx.AsyncClient],
+                       get_headers: Callable[[str], Dict[str, str]], concurrency: int = 64):
+        """POC分发前在clients的每个client上预热所有目标"""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def warm(client, url):
+            async with semaphore:
+                await self.warm(client, url, get_headers(url))
+
+        await asyncio.gather(*(warm(client, url) for url in urls for client in clients))
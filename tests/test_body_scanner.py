@@ -0,0 +1,74 @@
+import base64
+import os
+
+import httpx
+import pytest
+
+from scan.RuleMatcher import BodyScanner, RuleMatcher
+from scan.ScanPlan import compile_rule
+
+
+def regex_rule(val, op='=='):
+    return compile_rule({'position': 'body', 'type': 'regex', 'op': op, 'val': val, 'res_d': 'x'})
+
+
+IMAGE = base64.b64encode(os.urandom(7500)).decode()
+BODIES = {
+    'base64_image': f'<html><body>\n<img src="data:image/png;base64,{IMAGE}">\n</body></html>\n'.encode(),
+    'base64_line': f'<html>\n{IMAGE[:40]}\n</html>\n'.encode(),
+    'root_inline': ('x' * 5000 + 'uid=0(root) is not at start\n' + 'y' * 3000).encode(),
+    'root_line': ('x' * 100 + '\nroot:x:0:0:root:/root:/bin/bash\n' + 'y-' * 2500).encode(),
+    'word_boundary': ('a-' * 2045 + 'foobar' + '-z' * 2500).encode(),
+    'gbk': ('中文' * 3000 + '\n' + 'abc' * 20 + '\n').encode('gbk'),
+}
+RULES = [
+    regex_rule(r'^\w{32}'),
+    regex_rule(r'^[A-Za-z0-9\+/]+={0,2}$'),
+    regex_rule(r'^www-data|^root'),
+    regex_rule(r'\bbar'),
+    regex_rule(r'^abcabc'),
+    regex_rule(r'^\w{32}', '!='),
+]
+
+
+def make_response(name):
+    content_type = 'text/html; charset=gbk' if name == 'gbk' else 'text/html'
+    return httpx.Response(200, content=BODIES[name], headers={'Content-Type': content_type})
+
+
+def chunked_results(name, chunk_size, overlap):
+    response = make_response(name)
+    body = BODIES[name]
+    scanner = BodyScanner(RULES, overlap)
+    scanner.start(response)
+    for i in range(0, len(body), chunk_size):
+        scanner.feed(body[i:i + chunk_size])
+    scanner.finish()
+    return [result[0] for result in RuleMatcher(RULES).match(scanner.view)]
+
+
+@pytest.mark.parametrize('name', sorted(BODIES))
+@pytest.mark.parametrize('chunk_size', [1, 7, 100, 4000, 4096, 10 ** 6])
+def test_anchored_patterns_match_like_whole_body(name, chunk_size):
+    """分块增量匹配与完整响应体匹配结果一致(匹配跨度均小于overlap)"""
+    whole = [result[0] for result in RuleMatcher(RULES).match(make_response(name))]
+    assert chunked_results(name, chunk_size, 4096) == whole
+
+
+@pytest.mark.parametrize('name', sorted(BODIES))
+@pytest.mark.parametrize('overlap', [0, 16])
+def test_small_overlap_never_adds_matches(name, overlap):
+    """overlap不足时可能漏报，但不能出现完整响应体中不存在的匹配"""
+    whole = [result[0] for result in RuleMatcher(RULES).match(make_response(name))]
+    for chunk_size in (1, 7, 4000):
+        chunked = chunked_results(name, chunk_size, overlap)
+        for rule, expected, got in zip(RULES, whole, chunked):
+            if rule.op == '==':
+                assert not got or expected
+
+
+def test_catch_all_still_checks_headers():
+    """兜底页面只跳过正文搜索，正则规则仍按响应头判断"""
+    response = httpx.Response(200, content=b'uid=0(root)', headers={'X-Powered-By': 'ThinkPHP'})
+    rules = [regex_rule('ThinkPHP'), regex_rule(r'uid=\d+'), regex_rule('Struts', '!='), regex_rule('ThinkPHP', '!=')]
+    assert [result[0] for result in RuleMatcher(rules).match(response, catch_all=True)] == [True, False, True, False]